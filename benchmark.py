@@ -0,0 +1,254 @@
+# Benchmark suite for the Schedule application's core
+# Builds deterministic synthetic schedules (N groups, M tasks per group, years of history) and times the
+#   hot paths under a fixed clock, reporting time, peak memory, and how each one scales with size.
+#
+# Usage: python benchmark.py [--sizes 10,100,1000] [--tasks M] [--years Y] [--repeat R]
+#                            [--save baseline.json] [--compare baseline.json] [--tolerance 0.25]
+
+from datetime import datetime, timedelta
+import tracemalloc
+import tempfile
+import random
+import math
+import json
+import time
+import sys
+import main
+
+#----- VARIABLES -----
+CLOCK = datetime(2024, 6, 3, 9, 0)     # The fixed "now" every benchmark runs at
+SEED = 20230809                         # Seed for the synthetic data generators
+DEFAULT_SIZES = (10, 100, 1000)         # Numbers of groups to benchmark
+DEFAULT_TASKS = 3                       # Tasks per group
+DEFAULT_YEARS = 2                       # Years of task history
+DEFAULT_REPEAT = 5                      # Timed runs per benchmark (the median is reported)
+DEFAULT_TOLERANCE = 0.25                # Slowdown (as a fraction) that counts as a regression
+CHECK_DAYS = 365                        # Dates checked per group by the isGroupIncluded benchmark
+
+#----- FUNCTIONS -----
+# Helper function that picks a random group timing, covering each of the timing encodings
+def randomTiming(rng) -> list:
+    kind = rng.randrange(7)
+    if kind == 0:
+        return [0, 0, 0]                            # Every day
+    if kind == 1:
+        return [rng.randrange(1, 128), 0, 0]        # Days of the week
+    if kind == 2:
+        return [-rng.randrange(1, 7), 0, 0]         # Every Nth day
+    if kind == 3:
+        return [0, -rng.randrange(1, 4), 0]         # Every Nth week
+    if kind == 4:
+        return [rng.randrange(1, 128), rng.randrange(1, 1 << 52), 0]     # Days of chosen weeks
+    if kind == 5:
+        return [0, 0, rng.randrange(1, 4096)]       # Months of the year
+    return [rng.randrange(1, 128), 0, -rng.randrange(1, 12)]   # Days of every Nth month
+
+# Helper function that picks a random history value for a task type
+def randomValue(rng, ttype, maxCont) -> int:
+    if ttype == main.BINARY:
+        return rng.randrange(2)
+    if ttype == main.CONTINUOUS:
+        return rng.randrange(maxCont + 1)
+    return rng.randrange(10)
+
+# Fill a schedule with numGroups groups of tasksPerGroup tasks each, with historyDays of history ending
+#   yesterday. The same arguments always give the same schedule.
+def generateSchedule(schedule, numGroups, tasksPerGroup, historyDays) -> None:
+    rng = random.Random(SEED)
+    startDate = CLOCK - timedelta(days=historyDays)
+    schedule.lastDate = CLOCK
+
+    for g in range(numGroups):
+        groupName = "group" + str(g)
+        timing = randomTiming(rng)
+        schedule.allGroups[groupName] = main.Group(groupName, timing[0], timing[1], timing[2], startDate)
+    active = main.groupsActiveInRange(schedule.allGroups.values(), startDate, historyDays)
+
+    for g in range(numGroups):
+        groupName = "group" + str(g)
+        for t in range(tasksPerGroup):
+            taskName = groupName + "task" + str(t)
+            ttype = rng.randrange(3)
+            maxCont = rng.randrange(1, 10) if ttype == main.CONTINUOUS else -1
+            schedule.allTasks[taskName] = main.Task(taskName, ttype, groupName, maxCont)
+            schedule.linkTask(schedule.allGroups[groupName], taskName)
+
+            # Tasks get random values on the days their group was active and are excluded otherwise
+            history = main.TaskHistory(startDate.toordinal())
+            for included, runLen in main.bitRuns(active[groupName], historyDays):
+                if included:
+                    for _ in range(runLen):
+                        history.append(randomValue(rng, ttype, maxCont), 1)
+                else:
+                    history.append(0, runLen, 1)
+            schedule.taskHistory.tasks[taskName] = history
+            schedule.taskHistory.dirty.add(taskName)
+
+    schedule.getTodaysTasks(CLOCK)
+    return
+
+# Helper function that times func over a number of runs, returning the median time in seconds
+def timeRuns(func, repeat) -> float:
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - begin)
+    times.sort()
+    return times[len(times) // 2]
+
+# Helper function that gets the peak memory (in bytes) allocated while running func once
+def peakMemory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# Run every benchmark on one schedule size, returning {benchmark: {"time": seconds, "peak": bytes}}
+def benchmarkSize(numGroups, tasksPerGroup, historyDays, repeat) -> dict:
+    results = {}
+
+    def measure(name, func, setup=None):
+        # Each run gets its own setup (outside the timing) so the runs do the same work
+        def runOnce():
+            if setup is not None:
+                setup()
+            begin = time.perf_counter()
+            func()
+            return time.perf_counter() - begin
+        times = sorted(runOnce() for _ in range(repeat))
+        if setup is not None:
+            setup()
+        results[name] = {"time": times[len(times) // 2], "peak": peakMemory(func)}
+
+    with tempfile.TemporaryDirectory() as dataDir:
+        generate = lambda: generateSchedule(main.Schedule(dataDir), numGroups, tasksPerGroup, historyDays)
+        results["generate"] = {"time": timeRuns(generate, 1), "peak": peakMemory(generate)}
+        schedule = main.Schedule(dataDir)
+        generateSchedule(schedule, numGroups, tasksPerGroup, historyDays)
+
+        def checkAll():
+            for group in schedule.allGroups.values():
+                for day in range(CHECK_DAYS):
+                    main.isGroupIncluded(group.timing, CLOCK + timedelta(days=day), group.included)
+        measure("isGroupIncluded", checkAll)
+        measure("getTodaysTasks", lambda: schedule.getTodaysTasks(CLOCK), lambda: schedule.tasksToday.clear())
+
+        # Each updateTime run moves the clock on from where the last one stopped
+        for gap in (1, 30):
+            def catchUp(gap=gap):
+                schedule.lastDate = schedule.updateTime(schedule.lastDate + timedelta(days=gap))
+                schedule.getTodaysTasks(schedule.lastDate)
+            measure("updateTime (" + str(gap) + " days)", catchUp)
+
+        def snapshot():
+            schedule.taskHistory.dirty.update(schedule.taskHistory.tasks)
+            schedule.compactJournal()
+            schedule.saveData()
+        measure("saveData (snapshot)", snapshot)
+
+        def load():
+            loaded = main.Schedule(dataDir)
+            loaded.loadData()
+            loaded.saveData()
+        measure("loadData", load)
+
+        def loadAll():
+            loaded = main.Schedule(dataDir)
+            loaded.loadData()
+            for name in loaded.taskHistory:
+                loaded.taskHistory[name]
+            loaded.saveData()
+        measure("loadData (all history)", loadAll)
+
+        # What the program reads before showing its first menu
+        measure("readTodaySnapshot", lambda: schedule.readTodaySnapshot(schedule.lastDate))
+        schedule.saveData()
+
+    return results
+
+# Helper function that estimates how a benchmark scales (time ~ size^k), fitting k over all sizes
+def scalingExponent(sizes, times) -> float:
+    points = [(math.log(s), math.log(t)) for s, t in zip(sizes, times) if s > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    meanX = sum(x for x, _ in points) / len(points)
+    meanY = sum(y for _, y in points) / len(points)
+    spread = sum((x - meanX) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - meanX) * (y - meanY) for x, y in points) / spread
+
+# Print the results as a table, one row per benchmark, with the time and peak memory at each size
+def printResults(results) -> None:
+    sizes = sorted(int(s) for s in results)
+    names = list(results[str(sizes[0])])
+    print("%-26s" % "benchmark" + "".join("%22s" % ("groups=" + str(s)) for s in sizes) + "%10s" % "scaling")
+    for name in names:
+        times = [results[str(s)][name]["time"] for s in sizes]
+        row = "%-26s" % name
+        for s in sizes:
+            result = results[str(s)][name]
+            row += "%12.2f ms %6d KB" % (result["time"] * 1000, result["peak"] // 1024)
+        exponent = scalingExponent(sizes, times)
+        row += "%10s" % ("-" if exponent is None else "n^%.2f" % exponent)
+        print(row)
+    return
+
+# Compare results to a saved baseline, printing each ratio and returning the number of regressions
+def compareResults(results, baseline, tolerance) -> int:
+    regressions = 0
+    for size in results:
+        for name in results[size]:
+            if size not in baseline or name not in baseline[size]:
+                continue
+            for metric in ("time", "peak"):
+                old = baseline[size][name][metric]
+                new = results[size][name][metric]
+                if old <= 0:
+                    continue
+                ratio = new / old
+                flag = ""
+                if ratio > 1 + tolerance:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print("%-26s groups=%-6s %-5s %8.2fx%s" % (name, size, metric, ratio, flag))
+    return regressions
+
+# Helper function that gets the value after a command line flag
+def argValue(flag, default):
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+#----- MAIN -----
+if __name__ == "__main__":
+    sizes = [int(s) for s in argValue("--sizes", ",".join(str(s) for s in DEFAULT_SIZES)).split(",")]
+    tasksPerGroup = int(argValue("--tasks", DEFAULT_TASKS))
+    historyDays = int(float(argValue("--years", DEFAULT_YEARS)) * 365)
+    repeat = int(argValue("--repeat", DEFAULT_REPEAT))
+
+    results = {}
+    for size in sizes:
+        results[str(size)] = benchmarkSize(size, tasksPerGroup, historyDays, repeat)
+    printResults(results)
+
+    config = {"tasksPerGroup": tasksPerGroup, "historyDays": historyDays, "repeat": repeat, "clock": CLOCK.isoformat(),
+              "seed": SEED}
+    savePath = argValue("--save", None)
+    if savePath is not None:
+        with open(savePath, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=1)
+
+    comparePath = argValue("--compare", None)
+    if comparePath is not None:
+        with open(comparePath) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print("Baseline was run with different settings:", baseline["config"])
+        regressions = compareResults(results, baseline["results"], float(argValue("--tolerance", DEFAULT_TOLERANCE)))
+        if regressions:
+            print(regressions, "regression(s) found")
+            sys.exit(1)
@@ -2,30 +2,67 @@
 # 08/09/23
 # This is a simple prototype for the Schedule application
 
-from datetime import datetime, timedelta
-import dateutil.parser as dparser
+from datetime import datetime, date, timedelta, timezone
+from functools import lru_cache, wraps
+from contextlib import contextmanager
+from array import array
+from itertools import islice
+from bisect import bisect_left, bisect_right
+from collections import deque
+import threading
+import atexit
+import json
+import csv
+import re
 import pickle
+import mmap
+import time
+import sys
 import os
 
 #----- VARIABLES -----
+# -- Startup --
+launchTime = time.perf_counter()    # When the program started (after the module imports above)
+STARTUP_BUDGET = 0.25   # Seconds allowed from launch to the first menu
+TODAY_FILE = "today.pkl"    # Small snapshot of today's entry, shown while the rest of the data loads
+startupThread = None    # Thread loading the data and catching up to today when the program starts
+startupError = None     # Exception raised by startupThread, re-raised once the program waits for it
+
 # -- Constants --
 MAX_GROUP_TASKS = 2
-NULL_VAL = 1000    # For filler, starter entries in taskHistory arrays
+NULL_VAL = 1000    # For filler, starter entries in (old, list-based) taskHistory arrays
 # Task type markers:
 BINARY = 0
 CONTINUOUS = 1
 MEASURED = 2
+DELETED_TASK_TYPE = MEASURED  # Type a deleted task's history is read as (values are kept as they are)
 # Task history binary yes/no indicator for previous integer (NOTE: May not need these)
 YES = 1
 NO = 0
-# Value for tracking excluded tasks in Continuous task history (NOTE: May not need these)
+# Value for tracking excluded tasks in (old, list-based) Continuous task history
 EXCLUDED_CONT = 0.5
+# Graph time scale markers (for currGraph["timeScale"]):
+DAY_SCALE = 0
+WEEK_SCALE = 1
+MONTH_SCALE = 2
 
 # -- Hardcoded data --
+# Helper function that restores a pickled object of a class with __slots__. Objects pickled by older
+#   versions (before the classes had __slots__) have a plain attribute dict as their state.
+def setSlots(obj, state) -> None:
+    if isinstance(state, tuple):
+        state = state[1]
+    for key in state:
+        if key in obj.__slots__:
+            setattr(obj, key, state[key])
+    return
+
 class Group:    # Class that holds all data for each group
-    def __init__(self, name, timing1, timing2, timing3, currDate):
+    __slots__ = ("name", "taskPtrs", "timing", "included", "rrule", "mask")
+
+    def __init__(self, name, timing1, timing2, timing3, currDate, rrule=None):
         self.name = name
-        self.taskPtrs = []  # NOTE: May have to turn this into dict to make deleting tasks easier
+        self.taskPtrs = set()   # Names of the tasks in this group
         self.timing = [timing1, timing2, timing3]   # For day, week, and month respectively.
                                                     # If value is greater than 0, then specific 
                                                     #   days/weeks/months have been chosen based on bit 
@@ -34,271 +71,2441 @@ class Group:    # Class that holds all data for each group
                                                     # If the value is less than 0, then it is included after a
                                                     #   specific number of days/weeks/months based on abs(value).
         self.included = currDate    # The last active date this group was included in
+        # Optional iCalendar RRULE the group must also match (anchored to currDate unless it has a DTSTART)
+        self.rrule = None if rrule is None else anchorRule(rrule, currDate)
+        self.mask = compileTiming(self.timing, currDate, self.rrule)  # Compiled inclusion mask (see compileTiming)
+
+    def __setstate__(self, state):
+        self.rrule = None   # (Groups saved by older versions have no rule)
+        setSlots(self, state)
+
 
 class Task:     # Class that holds all data for each task
+    __slots__ = ("keyName", "ttype", "groupPtrs", "maxCont", "description", "displayOpt")
+
     def __init__(self, name, ttype, group, maxCont=-1, displayOpt=0):
         self.keyName = name
         self.ttype = ttype
-        self.groupPtrs = [group]
+        self.groupPtrs = {group}    # Names of the groups this task is in (kept in sync with Group.taskPtrs)
         self.maxCont = maxCont  # If applicable (only for CONTINUOUS task)
         self.description = ""
         self.displayOpt = displayOpt    # NOTE: Might take this out (only needs type)
 
+    def __setstate__(self, state):
+        setSlots(self, state)
+
 class OTTask:   # Class that holds all data for each one-time task
+    __slots__ = ("name", "ttype", "value", "maxCont")
+
     def __init__(self, name, ttype, maxCont=-1):
         self.name = name
         self.ttype = ttype
         self.value = 0
         self.maxCont = maxCont  # If applicable (only for CONTINUOUS task)
 
-# -- Schedule data --
-taskHistory = {}    # Keeps track of the complete/incomplete,excluded history of all tasks
-lastDate = datetime.today()    # Keeps track of when the app was last opened
-otherMedia = []     # Contains list of file names to additional media saved in SQLite
-allTasks = {}   # Contains all currently created Task objects that have a group
-oneTimeTasks = {}   # Contains all One-Time Task objects that were created since the last archive
-allGroups = []  # Contains all the current Group objects
-currGraph = {"dateRange": 0,
-             "timeScale": 0,
-             "addedTasks": [],
-             "dispSettings": []}    # Holds info about the most recent graph created
-otherVars = {}  # Reference variable just used for loading and saving data
-
-# -- Current display data --
-tasksToday = {}     # Key = [task name]; value = [integer for completion]
-                    # (Only includes recurring tasks, not one-time tasks)
-oneTimes = []   # Holds OTTask objects for the current day
+    def __setstate__(self, state):
+        setSlots(self, state)
+
+class TaskHistory:  # Class that holds the run-length encoded history of one task in typed columns
+    __slots__ = ("start", "days", "values", "runs", "excluded")
+
+    def __init__(self, start):
+        self.start = start          # Date ordinal of the first day in this history
+        self.days = 0               # Total number of days in this history
+        self.values = array('h')    # Value for each run (0 for excluded runs)
+        self.runs = array('H')      # Number of days in each run
+        self.excluded = array('B')  # 1 if the run is made of excluded days, otherwise 0
+        # NOTE: values and runs start out with 2-byte entries and are widened (to 'd' and 'I')
+        #       the first time a value or run doesn't fit.
+
+    # Add a run of days to the end of the history, merging it into the last run if possible
+    def append(self, value, days, excluded=0) -> None:
+        if excluded:
+            value = 0
+        if self.runs and self.excluded[-1] == excluded and self.values[-1] == value:
+            try:
+                self.runs[-1] += days
+            except OverflowError:
+                self.runs = array('I', self.runs)
+                self.runs[-1] += days
+        else:
+            try:
+                self.values.append(value)
+            except (OverflowError, TypeError):
+                self.values = array('d', self.values)
+                self.values.append(value)
+            try:
+                self.runs.append(days)
+            except OverflowError:
+                self.runs = array('I', self.runs)
+                self.runs.append(days)
+            self.excluded.append(excluded)
+        self.days += days
+        return
+
+# Helper function that memory-maps a data file for reading (None if it is empty)
+def mapFile(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class HistoryStore:     # Class that holds the TaskHistory of every task, keyed by task name
+    def __init__(self):
+        self.tasks = {}     # TaskHistory objects that have been loaded or created
+        self.mapped = {}    # Key = [task name]; value = [location of its columns in mappedFile]
+        self.mappedFile = None  # Memory-mapped history file from the last snapshot
+        self.reader = None  # Function that reads a mapped task's history instead (for other backends)
+        self.dirty = set()  # Names of the tasks changed since the last snapshot
+        self.replaced = set()   # Names of the dirty tasks whose history was replaced rather than added to
+        self.rollups = {}   # Key = [task name]; value = [TaskRollup], built the first time a task is graphed
+        self.indexes = {}   # Key = [task name]; value = [HistoryIndex], built the first time a task's history is queried
+        # NOTE: A task's history is only read out of mappedFile (or reader) the first time it is used.
+
+    def __contains__(self, name):
+        return name in self.tasks or name in self.mapped
+
+    def __getitem__(self, name):
+        history = self.tasks.get(name)
+        if history is None:
+            history = self.loadMapped(name)
+        return history
+
+    def __iter__(self):
+        yield from list(self.tasks)
+        yield from list(self.mapped)
+
+    def __len__(self):
+        return len(self.tasks) + len(self.mapped)
+
+    # Read a task's history out of the mapped snapshot file
+    def loadMapped(self, name) -> TaskHistory:
+        history = self.tasks[name] = self.readMapped(name, self.mapped.pop(name))
+        return history
+
+    # Get a task's history without keeping it loaded (for reading every task once, like an export)
+    def peek(self, name) -> TaskHistory:
+        history = self.tasks.get(name)
+        if history is None:
+            history = self.readMapped(name, self.mapped[name])
+        return history
+
+    # Helper function that reads a task's history from its location in mappedFile (or through reader)
+    def readMapped(self, name, location) -> TaskHistory:
+        if self.reader is not None:
+            return self.reader(name, location)
+
+        start, days, valuesCode, runsCode, numRuns, offset = location
+        history = TaskHistory(start)
+        history.days = days
+        history.values = array(valuesCode)
+        history.runs = array(runsCode)
+        if numRuns == 0:    # (The history file is empty, and so isn't mapped, if no task has any runs)
+            return history
+        view = memoryview(self.mappedFile)
+        for column in (history.values, history.runs, history.excluded):
+            end = offset + column.itemsize * numRuns
+            column.frombytes(view[offset:end])
+            offset = end
+        view.release()
+        return history
+
+    # Use a snapshot history file (and its index) as the source for tasks that haven't been loaded
+    def mapSnapshot(self, path, index) -> None:
+        self.mappedFile = mapFile(path)
+        self.mapped = index
+        return
+
+    # Get the history file contents and index for a snapshot. Tasks that were never loaded are
+    #   copied straight from the mapped file.
+    def snapshot(self) -> tuple:
+        chunks = []
+        index = {}
+        offset = 0
+        for name in self.tasks:
+            history = self.tasks[name]
+            index[name] = (history.start, history.days, history.values.typecode, history.runs.typecode,
+                           len(history.runs), offset)
+            for column in (history.values, history.runs, history.excluded):
+                chunks.append(column.tobytes())
+                offset += len(chunks[-1])
+        for name in self.mapped:
+            start, days, valuesCode, runsCode, numRuns, oldOffset = self.mapped[name]
+            size = (array(valuesCode).itemsize + array(runsCode).itemsize + 1) * numRuns
+            index[name] = (start, days, valuesCode, runsCode, numRuns, offset)
+            if size:    # (The mapped file is empty, and so isn't mapped, if no task had any runs)
+                chunks.append(self.mappedFile[oldOffset:oldOffset + size])
+            offset += size
+
+        return (b"".join(chunks), index)
+
+    # Start a new, empty history for a task (replacing any old one) from the given date
+    def create(self, name, startDate) -> None:
+        self.mapped.pop(name, None)
+        self.tasks[name] = TaskHistory(toDate(startDate).toordinal())
+        self.dirty.add(name)
+        self.replaced.add(name)
+        self.rollups.pop(name, None)
+        self.indexes.pop(name, None)
+        return
+
+    # Add days with a recorded value (and to the task's rollup and index, if they have been built)
+    def append(self, name, value, days=1) -> None:
+        if metricsEnabled:
+            countMetric("history_entries_appended")
+        history = self[name]
+        if name in self.rollups:
+            self.rollups[name].addRun(history.start + history.days, value, days, 0)
+        numRuns = len(history.runs)
+        history.append(value, days)
+        if name in self.indexes:
+            self.indexes[name].addRun(value, days, 0, len(history.runs) == numRuns)
+        self.dirty.add(name)
+        return
+
+    # Add excluded days
+    def exclude(self, name, days=1) -> None:
+        if metricsEnabled:
+            countMetric("history_entries_appended")
+        history = self[name]
+        if name in self.rollups:
+            self.rollups[name].addRun(history.start + history.days, 0, days, 1)
+        numRuns = len(history.runs)
+        history.append(0, days, 1)
+        if name in self.indexes:
+            self.indexes[name].addRun(0, days, 1, len(history.runs) == numRuns)
+        self.dirty.add(name)
+        return
+
+class OneTimeStore:     # Class that holds the one-time tasks of past days, keyed by date
+    # Columns of the archive file and their array typecodes (largest items first, so each column is aligned)
+    COLUMNS = (("values", "d"), ("days", "I"), ("names", "I"), ("maxConts", "i"), ("types", "B"))
+
+    def __init__(self):
+        self.dates = {}     # Key = [date]; value = [list of OTTask objects] for dates that aren't archived yet
+        self.columns = None     # Key = [column name]; value = [column of the memory-mapped archive], sorted by day
+        self.names = []     # Task names in the archive (its names column holds indexes into this list)
+        self.mappedFile = None  # Memory-mapped archive file from the last snapshot
+        self.reader = None  # Function that reads archived rows in a date range instead (for other backends)
+        self.dirty = set()  # Dates changed since the last snapshot
+        self.snapshotDays = []  # Dates written by the last snapshot
+        self.snapshotIndex = None   # Archive index of the last snapshot
+
+    # Get the archived (day ordinal, name, type, value, maxCont) rows between two day ordinals
+    #   (inclusive) in date order
+    def archiveRows(self, firstOrdinal, lastOrdinal):
+        if self.reader is not None:
+            yield from self.reader(firstOrdinal, lastOrdinal)
+        elif self.columns is not None:
+            days, names, types, values, maxConts = (self.columns[key] for key in
+                                                    ("days", "names", "types", "values", "maxConts"))
+            for i in range(bisect_left(days, firstOrdinal), bisect_right(days, lastOrdinal)):
+                value = values[i]
+                yield (days[i], self.names[names[i]], types[i], int(value) if value.is_integer() else value,
+                       maxConts[i])
+        return
+
+    # Get the rows of all one-time tasks (archived or not) between two day ordinals in date order
+    def rows(self, firstOrdinal, lastOrdinal):
+        pending = sorted(day.toordinal() for day in self.dates if firstOrdinal <= day.toordinal() <= lastOrdinal)
+        p = 0
+        for row in self.archiveRows(firstOrdinal, lastOrdinal):
+            while p < len(pending) and pending[p] < row[0]:
+                yield from self.pendingRows(pending[p])
+                p += 1
+            # Dates changed since they were archived are held in full in self.dates
+            if p < len(pending) and pending[p] == row[0]:
+                continue
+            yield row
+        for ordinal in pending[p:]:
+            yield from self.pendingRows(ordinal)
+        return
 
+    # Helper function that gets the rows of a date that isn't archived yet
+    def pendingRows(self, ordinal):
+        for ott in self.dates[date.fromordinal(ordinal)]:
+            yield (ordinal, ott.name, ott.ttype, ott.value, ott.maxCont)
+        return
+
+    def __contains__(self, day):
+        return day in self.dates or any(True for _ in self.archiveRows(day.toordinal(), day.toordinal()))
+
+    # Archived dates are rebuilt from the archive each time rather than being kept in memory
+    def __getitem__(self, day):
+        otts = self.dates.get(day)
+        if otts is None:
+            otts = [ott for _, ott in self.between(day, day)]
+            if not otts:
+                raise KeyError(day)
+        return otts
+
+    def __iter__(self):
+        lastOrdinal = None
+        for row in self.rows(1, date.max.toordinal()):
+            if row[0] != lastOrdinal:
+                lastOrdinal = row[0]
+                yield date.fromordinal(lastOrdinal)
+        return
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # Get the one-time tasks between two dates (inclusive) as (date, OTTask) pairs in date order
+    def between(self, startDate, endDate):
+        for ordinal, name, ttype, value, maxCont in self.rows(toDate(startDate).toordinal(), toDate(endDate).toordinal()):
+            ott = OTTask(name, ttype, maxCont)
+            ott.value = value
+            yield (date.fromordinal(ordinal), ott)
+        return
+
+    # Store the one-time tasks of a day
+    def add(self, day, otts) -> None:
+        if day in self:
+            self.dates[day] = self[day] + list(otts)
+        else:
+            self.dates[day] = list(otts)
+        self.dirty.add(day)
+        return
+
+    # Use a snapshot archive file (and its index) as the source for archived dates
+    def mapSnapshot(self, path, index) -> None:
+        self.mappedFile = mapFile(path)
+        self.names = [sys.intern(name) for name in index["names"]]
+        self.columns = None
+        if self.mappedFile is not None:
+            view = memoryview(self.mappedFile)
+            self.columns = {}
+            for key, code in self.COLUMNS:
+                offset = index["columns"][key]
+                self.columns[key] = view[offset:offset + index["count"] * array(code).itemsize].cast(code)
+        return
+
+    # Get the archive file contents and index for a snapshot, holding every date in one set of columns
+    def snapshot(self) -> tuple:
+        columns = {key: array(code) for key, code in self.COLUMNS}
+        names = []
+        nameIds = {}
+        for ordinal, name, ttype, value, maxCont in self.rows(1, date.max.toordinal()):
+            if name not in nameIds:
+                nameIds[name] = len(names)
+                names.append(name)
+            columns["days"].append(ordinal)
+            columns["names"].append(nameIds[name])
+            columns["types"].append(ttype)
+            columns["values"].append(value)
+            columns["maxConts"].append(maxCont)
+
+        index = {"count": len(columns["days"]), "names": names, "columns": {}}
+        offset = 0
+        for key, code in self.COLUMNS:
+            index["columns"][key] = offset
+            offset += len(columns[key]) * columns[key].itemsize
+        self.snapshotDays = list(self.dates)
+        self.snapshotIndex = index
+        self.dirty.clear()
+        return (b"".join(columns[key].tobytes() for key, _ in self.COLUMNS), index)
+
+    # Read the dates written by the last snapshot from its (saved) archive file instead of keeping them
+    #   in memory. Dates changed since the snapshot was taken stay in memory.
+    def archive(self, path) -> None:
+        self.mapSnapshot(path, self.snapshotIndex)
+        for day in self.snapshotDays:
+            if day not in self.dirty:
+                self.dates.pop(day, None)
+        self.snapshotDays = []
+        return
+
+class TaskRollup:   # Class that holds the cached weekly/monthly aggregates and streaks of one task
+    def __init__(self, ttype, maxCont):
+        self.ttype = ttype
+        self.maxCont = maxCont
+        self.weeks = {}     # Key = [ordinal of the week's Monday]; value = [included days, completed days, value sum]
+        self.months = {}    # Key = [ordinal of the month's 1st]; value = [included days, completed days, value sum]
+        self.currentStreak = 0  # Completed days in a row up to the end of the history (excluded days are skipped)
+        self.longestStreak = 0
+
+    # Check if a day's value means the task was completed
+    def isCompleted(self, value) -> bool:
+        return taskCompleted(self.ttype, value, self.maxCont)
+
+    # Add a run of days starting on the given date ordinal. Only touches the weeks and months the run
+    #   covers, so long runs of days cost O(periods).
+    def addRun(self, startOrdinal, value, days, excluded) -> None:
+        if excluded:
+            return
+
+        completed = self.isCompleted(value)
+        if completed:
+            self.currentStreak += days
+            self.longestStreak = max(self.longestStreak, self.currentStreak)
+        else:
+            self.currentStreak = 0
+
+        for scale, buckets in ((WEEK_SCALE, self.weeks), (MONTH_SCALE, self.months)):
+            ordinal = startOrdinal
+            endOrdinal = startOrdinal + days
+            while ordinal < endOrdinal:
+                key = periodStart(ordinal, scale)
+                numDays = min(nextPeriod(key, scale), endOrdinal) - ordinal
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = [0, 0, 0]
+                bucket[0] += numDays
+                if completed:
+                    bucket[1] += numDays
+                bucket[2] += value * numDays
+                ordinal += numDays
+
+        return
+
+class HistoryIndex:     # Class that holds a skip index over one task's history runs for point and range queries
+    __slots__ = ("history", "ttype", "maxCont", "ends", "included", "completed", "valueSums")
+
+    def __init__(self, history, ttype, maxCont):
+        self.history = history  # TaskHistory being indexed
+        self.ttype = ttype
+        self.maxCont = maxCont
+        # Running totals at the end of each run, so any day can be found by binary search
+        self.ends = array('I')      # Days in the history up to the end of each run
+        self.included = array('I')  # Included days up to the end of each run
+        self.completed = array('I')     # Completed days up to the end of each run
+        self.valueSums = array('d')     # Sum of the included days' values up to the end of each run
+
+        for i in range(len(history.runs)):
+            self.addRun(history.values[i], history.runs[i], history.excluded[i], False)
+
+    # Add a run of days to the index after it was added to the history (merged if it was added onto
+    #   the history's last run)
+    def addRun(self, value, days, excluded, merged) -> None:
+        included = 0 if excluded else days
+        completed = included if taskCompleted(self.ttype, value, self.maxCont) else 0
+        if merged:
+            self.ends[-1] += days
+            self.included[-1] += included
+            self.completed[-1] += completed
+            self.valueSums[-1] += value * included
+        elif self.ends:
+            self.ends.append(self.ends[-1] + days)
+            self.included.append(self.included[-1] + included)
+            self.completed.append(self.completed[-1] + completed)
+            self.valueSums.append(self.valueSums[-1] + value * included)
+        else:
+            self.ends.append(days)
+            self.included.append(included)
+            self.completed.append(completed)
+            self.valueSums.append(value * included)
+        return
+
+    # Get the run that holds the day at an offset from the start of the history
+    def runAt(self, offset) -> int:
+        return bisect_right(self.ends, offset)
+
+    # Get the (included days, completed days, value sum) of the first numDays days of the history
+    def totals(self, numDays) -> tuple:
+        i = bisect_right(self.ends, numDays)
+        included = completed = 0
+        valueSum = 0
+        runStart = 0
+        if i > 0:
+            included = self.included[i - 1]
+            completed = self.completed[i - 1]
+            valueSum = self.valueSums[i - 1]
+            runStart = self.ends[i - 1]
+
+        # Part of run i is in the first numDays days
+        partDays = numDays - runStart
+        if partDays > 0 and not self.history.excluded[i]:
+            value = self.history.values[i]
+            included += partDays
+            if taskCompleted(self.ttype, value, self.maxCont):
+                completed += partDays
+            valueSum += value * partDays
+
+        return (included, completed, valueSum)
+
+class TodaySummary:     # Class that holds the derived state of today's entry (status lines, totals, streaks)
+    def __init__(self, schedule):
+        self.schedule = schedule    # Schedule whose entry this is
+        self.lines = {}     # Key = [recurring task name]; value = [status line]
+        self.oneTimeLines = []  # Status lines of the one-time tasks (in the same order as oneTimes)
+        self.completed = set()  # Names of the recurring tasks completed today
+        self.oneTimeCompleted = []  # Whether each one-time task is completed (in the same order as oneTimes)
+        self.completedCount = 0     # Tasks (recurring and one-time) completed today
+        self.streaks = {}   # Key = [recurring task name]; value = [streak up to yesterday]
+
+        for t in schedule.tasksToday:
+            self.streaks[t] = schedule.currentStreak(t)
+            self.markRecurring(t, schedule.tasksToday[t])
+        for i in range(len(schedule.oneTimes)):
+            self.oneTimeLines.append("")
+            self.oneTimeCompleted.append(False)
+            self.markOneTime(i)
+
+    # Get a recurring task's streak, counting today once it has been completed
+    def streak(self, taskName) -> int:
+        return self.streaks[taskName] + (taskName in self.completed)
+
+    # Update the derived state after a recurring task's value changes
+    def markRecurring(self, taskName, value) -> None:
+        task = self.schedule.allTasks[taskName]
+        wasCompleted = taskName in self.completed
+        if taskCompleted(task.ttype, value, task.maxCont):
+            self.completed.add(taskName)
+        else:
+            self.completed.discard(taskName)
+        self.completedCount += (taskName in self.completed) - wasCompleted
+
+        self.lines[taskName] = task.keyName + ": " + taskStatus(task.ttype, value, task.maxCont)
+        if self.streak(taskName) > 0:
+            self.lines[taskName] += " (streak: " + str(self.streak(taskName)) + ")"
+        return
+
+    # Update the derived state after the value of oneTimes[index] changes
+    def markOneTime(self, index) -> None:
+        ott = self.schedule.oneTimes[index]
+        completed = taskCompleted(ott.ttype, ott.value, ott.maxCont)
+        self.completedCount += completed - self.oneTimeCompleted[index]
+        self.oneTimeCompleted[index] = completed
+        self.oneTimeLines[index] = ott.name + ": " + taskStatus(ott.ttype, ott.value, ott.maxCont)
+        return
+
+    # Get the number of tasks in today's entry
+    def taskCount(self) -> int:
+        return len(self.lines) + len(self.oneTimeLines)
+
+# -- Persistence --
+dataDir = "."   # Directory that the interactive program keeps its schedule data files in
+SNAPSHOT_FILES = ("taskhistory.bin", "historyindex.pkl", "onetimetasks.bin", "onetimeindex.pkl", "alltasks.pkl",
+                  "currgraph.pkl", "taskstoday.pkl",
+                  "othervars.pkl")    # othervars.pkl must stay last, since it marks a finished snapshot
+# NOTE: Each snapshot writes the other files under new names (see snapshotFileName) and lists them in
+#       othervars.pkl, so replacing othervars.pkl switches to the new snapshot in one step.
+OLD_SNAPSHOT_FILES = ("taskhistory.pkl", "onetimetasks.pkl")   # Fully pickled files from older versions
+JOURNAL_FILE = "journal.pkl"    # Append-only log of the changes made since the last snapshot
+COMPACT_AFTER = 500     # Number of journal entries before they get compacted into a new snapshot
+SQLITE_FILE = "schedule.db"     # Database used by the SQLite storage backend
+storageType = "file"    # Storage backend for new data directories ("file" or "sqlite")
+journalOps = {}     # Key = [function name]; value = [function], for replaying the journal
+LOCK_FILE = "schedule.lock"     # Locked by a process while it writes to the data directory
+VERSION_FILE = "version"    # Version stamp: sequence number of the last change written by any process
+
+# -- Background saving --
+SAVE_INTERVAL = 2.0     # Seconds between the background saver's writes
+saverThread = None  # Background saver thread (see startSaver)
+saverStop = threading.Event()   # Set to stop the background saver
+saveConflict = None     # SaveConflict found by the background saver (changes are held until it is resolved)
+
+# -- Forecasts --
+FORECAST_DAYS = 30      # Default number of upcoming days to forecast
+FORECAST_CACHE = 512    # Number of forecasts remembered (least recently used are dropped first)
+
+# -- Recurrence rules --
+RULE_CACHE = 1024   # Number of (rule, year) occurrence bitmaps remembered
+
+# -- Metrics --
+metricsEnabled = False  # Whether operation timers and counters are recorded (see timed and countMetric)
+METRICS_SAMPLES = 1024  # Number of recent durations kept per operation for its percentiles
+METRICS_QUANTILES = (0.5, 0.9, 0.99)    # Percentiles exported for each operation
+metricTimes = {}    # Key = [operation name]; value = [number of calls, total seconds, recent durations]
+metricCounts = {}   # Key = [counter name]; value = [total]
+metricsLock = threading.Lock()  # Held while a metric is being updated (compaction can run on its own thread)
+
+# -- Bulk import --
+IMPORT_BATCH = 10000    # Number of import records read and checked at a time
+IMPORT_FIELDS = ("kind", "name", "type", "maxCont", "group", "task", "day", "week", "month", "rrule", "date", "value",
+                 "days", "excluded")    # Columns used in import files (a CSV file needs a header row with these)
+
+# -- Export --
+EXPORT_CHUNK = 4096     # Number of export records decoded and written at a time
+EXPORT_FIELDS = ("date", "task", "group", "type", "value", "excluded")  # Fields of each exported record
+EXPORT_MAGIC = b"SCHEDULE-EXPORT-1\n"   # Start of a columnar export file
+EXPORT_COLUMNS = (("date", 'I'), ("task", 'I'), ("group", 'I'), ("type", 'B'), ("value", 'd'),
+                  ("excluded", 'B'))    # Column types in a columnar export (dates are ordinals, names are indexes)
+
+# -- Server mode --
+SERVER_PORT = 8080  # Default port for server mode
+SERVER_MAX_USERS = 1000     # Number of users' schedules kept in memory before the least recently used is saved
+USERS_DIR = "users"     # Directory (under the server's data directory) holding one data directory per user
+
+# -- Batch rollover --
+ROLLOVER_PROGRESS_FILE = "rollover-progress.jsonl"  # Log of finished directories (under the root directory)
+ROLLOVER_REPORT_SLOWEST = 10    # Number of slowest directories listed in the batch rollover report
+
+# -- Interactive program --
+schedule = None     # Schedule the interactive program shows and changes (see Schedule)
 
 #----- FUNCTIONS -----
+# Decorator that records how long each call of a function takes under an operation name.
+# When metrics are off this only adds one check per call.
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metricsEnabled:
+                return func(*args, **kwargs)
+            begin = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recordTime(name, time.perf_counter() - begin)
+
+        return wrapper
+    return decorator
+
+# Helper function that adds one duration (in seconds) to an operation's timer
+def recordTime(name, seconds) -> None:
+    with metricsLock:
+        entry = metricTimes.get(name)
+        if entry is None:
+            entry = metricTimes[name] = [0, 0.0, deque(maxlen=METRICS_SAMPLES)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2].append(seconds)
+    return
+
+# Add to a counter
+# NOTE: Callers check metricsEnabled first, so counting costs nothing when metrics are off.
+def countMetric(name, amount=1) -> None:
+    with metricsLock:
+        metricCounts[name] = metricCounts.get(name, 0) + amount
+    return
+
+# Get the call count, total time, and latency percentiles of each operation, and every counter
+def metricsSummary() -> dict:
+    operations = {}
+    with metricsLock:
+        for name in metricTimes:
+            count, total, samples = metricTimes[name]
+            ordered = sorted(samples)
+            stats = {"count": count, "sum": total, "max": ordered[-1]}
+            for q in METRICS_QUANTILES:
+                stats["p" + str(round(q * 100))] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            operations[name] = stats
+        counters = dict(metricCounts)
+    return {"operations": operations, "counters": counters}
+
+# Get the metrics in the Prometheus text format
+def metricsText() -> str:
+    summary = metricsSummary()
+    lines = ["# TYPE schedule_operation_seconds summary"]
+    for name in summary["operations"]:
+        stats = summary["operations"][name]
+        for q in METRICS_QUANTILES:
+            lines.append('schedule_operation_seconds{operation="%s",quantile="%g"} %r'
+                         % (name, q, stats["p" + str(round(q * 100))]))
+        lines.append('schedule_operation_seconds_sum{operation="%s"} %r' % (name, stats["sum"]))
+        lines.append('schedule_operation_seconds_count{operation="%s"} %d' % (name, stats["count"]))
+    for name in summary["counters"]:
+        lines.append("# TYPE schedule_%s_total counter" % name)
+        lines.append("schedule_%s_total %r" % (name, summary["counters"][name]))
+    return "\n".join(lines) + "\n"
+
+# Write the metrics to a file, in the Prometheus text format for .prom/.txt files and JSON otherwise
+def writeMetrics(path) -> None:
+    if path.endswith((".prom", ".txt")):
+        text = metricsText()
+    else:
+        text = json.dumps(metricsSummary(), indent=1)
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+    return
+
+# Helper function that turns a date or datetime into a date
+def toDate(d) -> date:
+    if isinstance(d, datetime):
+        return d.date()
+    return d
+
+# Helper function that returns the (weekday, ISO week, month) of a date. Cached, since the same
+# few dates are checked against every group.
+@lru_cache(maxsize=4096)
+def calendarFields(d) -> tuple:
+    return (d.weekday(), d.isocalendar()[1], d.month)
+
+# Compile a group's timing into an inclusion mask: a (day, week, month) tuple of bitmasks where
+#   bit i is set if weekday i (0-6), ISO week i (1-53), or month i (1-12) is included. Groups with a
+#   recurrence rule get the (anchored) rule as a fourth item, so the rule is part of anything keyed by the mask.
+# NOTE: Group.included only ever moves to dates that pass every "every Nth" check, so it always
+#       stays in the same residue class as the date the group was created on. This means the
+#       mask only needs to be compiled once per group.
+def compileTiming(groupTiming, dateIncl, rrule=None) -> tuple:
+    inclFields = calendarFields(toDate(dateIncl))
+    mask = _compileTiming(tuple(groupTiming), inclFields)
+    if rrule is not None:
+        mask += (rrule,)
+    return mask
+
+@lru_cache(maxsize=1024)
+def _compileTiming(groupTiming, inclFields) -> tuple:
+    mask = []
+    # Period positions for weekday, week, and month along with how the timing bits are laid out
+    #   (the first period is the highest bit)
+    for timing, inclPos, first, last, topBit in ((groupTiming[0], inclFields[0], 0, 6, 6),
+                                                (groupTiming[1], inclFields[1], 1, 53, 52),
+                                                (groupTiming[2], inclFields[2], 1, 12, 12)):
+        bits = 0
+        for pos in range(first, last + 1):
+            if timing > 0:
+                # Week 53 has no bit of its own, so it is never chosen
+                include = topBit - pos >= 0 and (timing >> (topBit - pos)) & 1
+            elif timing < 0:
+                include = ((pos - inclPos) % abs(timing)) == 0
+            else:
+                include = True
+            if include:
+                bits |= 1 << pos
+        mask.append(bits)
+
+    return tuple(mask)
+
+# Helper function that gets the compiled mask of a group (older saved groups may not have one)
+def groupMask(group) -> tuple:
+    mask = getattr(group, "mask", None)
+    if mask is None:
+        mask = compileTiming(group.timing, group.included, group.rrule)
+        group.mask = mask
+    return mask
+
+# Helper function that checks a date against a compiled group mask
+def maskIncludes(mask, dateCheck) -> bool:
+    checkDate = toDate(dateCheck)
+    weekDay, weekNum, month = calendarFields(checkDate)
+    if not (mask[2] >> month) & (mask[1] >> weekNum) & (mask[0] >> weekDay) & 1:
+        return False
+    return len(mask) < 4 or ruleIncludes(mask[3], checkDate)
+
 # Helper function that checks if the date applies to the group
-def isGroupIncluded(groupTiming, dateCheck, dateIncl) -> bool:
-    # Check if this group is valid today by going through month, week, and then day
-    include = True
-    if groupTiming[2] > 0 and include:
-        include = (groupTiming[2] >> (12 - dateCheck.date().month)) & 1
-    elif groupTiming[2] < 0 and include:
-        include = ((dateCheck.date().month - dateIncl.month) % abs(groupTiming[2])) == 0
-
-    weekNum = dateCheck.isocalendar()[1]
-    if groupTiming[1] > 0 and include:
-        include = (groupTiming[1] >> (52 - weekNum)) & 1
-    elif groupTiming[1] < 0 and include:
-        include = ((weekNum - dateIncl.isocalendar()[1]) % abs(groupTiming[1])) == 0
-
-    weekDay = dateCheck.weekday()
-    if groupTiming[0] > 0 and include:
-        include = (groupTiming[0] >> (6 - weekDay)) & 1
-    elif groupTiming[0] < 0 and include:
-        include = (abs(weekDay - dateIncl.weekday()) % abs(groupTiming[0])) == 0
-
-    return include
-
-# Fill the tasksToday list with the tasks that apply today
-def getTodaysTasks(newDate) -> None:
-    # Look in groups for repeating tasks
-    for group in allGroups:
-        # Check if this group is valid
-        include = isGroupIncluded(group.timing, newDate, group.included)
-        if not include:
-            continue
-        group.included = newDate    # Update included date for this group
+def isGroupIncluded(groupTiming, dateCheck, dateIncl, rrule=None) -> bool:
+    return maskIncludes(compileTiming(groupTiming, dateIncl, rrule), dateCheck)
+
+# Helper function that anchors a recurrence rule (e.g. "FREQ=MONTHLY;BYDAY=2TU") to a start date, unless
+#   it has its own DTSTART, so rules like "every 3 days" count from when the group was made.
+# Raises ValueError if the rule can't be used.
+def anchorRule(rrule, startDate) -> str:
+    rrule = localRuleTimes(rrule.strip())
+    if "DTSTART" not in rrule.upper():
+        if not rrule.upper().startswith("RRULE:"):
+            rrule = "RRULE:" + rrule
+        rrule = "DTSTART:" + toDate(startDate).strftime("%Y%m%d") + "\n" + rrule
+    try:
+        ruleYearBits(rrule, toDate(startDate).year)
+    except ValueError as e:
+        raise ValueError("Invalid recurrence rule " + repr(rrule) + ": " + str(e))
+    except TypeError:   # A DTSTART with a TZID can't be compared to the local dates it is checked on
+        raise ValueError("Invalid recurrence rule " + repr(rrule) + ": only UTC and local times are supported")
+    return rrule
+
+# Helper function that turns the UTC times in a rule (DTSTART:...Z or UNTIL=...Z, as calendar apps
+#   export them) into local times, since rules are checked against local dates
+def localRuleTimes(rrule) -> str:
+    def toLocal(match):
+        utcTime = datetime.strptime(match.group(2), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+        return match.group(1) + utcTime.astimezone().strftime("%Y%m%dT%H%M%S")
+
+    return re.sub(r"(DTSTART:|UNTIL=)(\d{8}T\d{6})Z", toLocal, rrule, flags=re.IGNORECASE)
+
+# Helper function that parses an anchored recurrence rule
+@lru_cache(maxsize=RULE_CACHE)
+def compileRule(rrule):
+    from dateutil.rrule import rrulestr     # Only needed by groups with a recurrence rule
+
+    return rrulestr(rrule, forceset=True)
+
+# Get the days of a year that a recurrence rule includes, as an integer bitset where bit i is set if
+#   (January 1 + i days) is an occurrence. Iterating a rule is slow, so each year is only worked out once.
+@lru_cache(maxsize=RULE_CACHE)
+def ruleYearBits(rrule, year) -> int:
+    yearStart = date(year, 1, 1).toordinal()
+    bits = 0
+    for occurrence in compileRule(rrule).between(datetime(year, 1, 1), datetime(year, 12, 31, 23, 59, 59), inc=True):
+        bits |= 1 << (occurrence.toordinal() - yearStart)
+    return bits
+
+# Helper function that checks a date against a recurrence rule
+def ruleIncludes(rrule, checkDate) -> bool:
+    return bool((ruleYearBits(rrule, checkDate.year) >> (checkDate.timetuple().tm_yday - 1)) & 1)
+
+# Helper function that gets the bitset of the days in a date range (bit i = startOrdinal + i) that a
+#   recurrence rule includes, stitched together from its yearly bitsets
+def ruleBitsInRange(rrule, startOrdinal, numDays) -> int:
+    bits = 0
+    for year in range(date.fromordinal(startOrdinal).year, date.fromordinal(startOrdinal + numDays - 1).year + 1):
+        shift = date(year, 1, 1).toordinal() - startOrdinal
+        yearBits = ruleYearBits(rrule, year)
+        bits |= yearBits << shift if shift >= 0 else yearBits >> -shift
+    return bits & ((1 << numDays) - 1)
+
+# Build the calendar bitsets of a date range: a (day, week, month) tuple of lists where item i is an
+#   integer bitset of the days in the range (bit j = startOrdinal + j) that are on weekday i (0-6),
+#   ISO week i (1-53), or month i (1-12).
+# Cached, since the same ranges (today onwards, or the days since the app was last opened) come up
+#   again and again.
+@lru_cache(maxsize=64)
+def calendarBits(startOrdinal, numDays) -> tuple:
+    start = date.fromordinal(startOrdinal)
+    fullBits = (1 << numDays) - 1
+
+    # Days in the range that land on each weekday (bits every 7 days, shifted into place)
+    everySeventh = ((1 << (7 * ((numDays + 6) // 7 + 1))) - 1) // 127
+    dayBits = [((everySeventh << ((wd - start.weekday()) % 7)) & fullBits) for wd in range(7)]
+
+    # Days in the range that land on each ISO week and month (both are contiguous spans)
+    weekBits = [0] * 54
+    monthBits = [0] * 13
+    offset = 0
+    while offset < numDays:
+        spanStart = start + timedelta(days=offset)
+        spanLen = min(7 - spanStart.weekday(), numDays - offset)
+        weekBits[calendarFields(spanStart)[1]] |= ((1 << spanLen) - 1) << offset
+        offset += spanLen
+    offset = 0
+    while offset < numDays:
+        spanStart = start + timedelta(days=offset)
+        nextMonth = date(spanStart.year + spanStart.month // 12, spanStart.month % 12 + 1, 1)
+        spanLen = min((nextMonth - spanStart).days, numDays - offset)
+        monthBits[spanStart.month] |= ((1 << spanLen) - 1) << offset
+        offset += spanLen
+
+    return (tuple(dayBits), tuple(weekBits), tuple(monthBits))
+
+# Helper function that combines the calendar bitsets of a range (calendarBits(startOrdinal, numDays))
+#   for a compiled group mask, giving the bitset of the days in the range that the mask includes
+def maskBitsInRange(mask, calendar, startOrdinal, numDays) -> int:
+    combined = []
+    for maskBits, periodBits in zip(mask, calendar):
+        bits = 0
+        for pos in range(len(periodBits)):
+            if (maskBits >> pos) & 1:
+                bits |= periodBits[pos]
+        combined.append(bits)
+    if len(mask) > 3:
+        combined.append(ruleBitsInRange(mask[3], startOrdinal, numDays))
+    return combined[0] & combined[1] & combined[2] & combined[-1]
+
+# Find the days in a date range that each group is active on. Returns a dict of group name to an
+#   integer bitset, where bit i is set if the group is included on (startDate + i days).
+# The calendar bitsets are built once for the range and shared by all groups, so each group only
+#   costs a few big integer ORs/ANDs no matter how long the range is.
+def groupsActiveInRange(groups, startDate, numDays) -> dict:
+    if numDays <= 0:
+        return {group.name: 0 for group in groups}
+    startOrdinal = toDate(startDate).toordinal()
+    calendar = calendarBits(startOrdinal, numDays)
+
+    # Groups with the same mask share the result
+    combined = {}
+    active = {}
+    for group in groups:
+        mask = groupMask(group)
+        if mask not in combined:
+            combined[mask] = maskBitsInRange(mask, calendar, startOrdinal, numDays)
+        active[group.name] = combined[mask]
+
+    return active
+
+# Helper function that gets the days (as dates) in a range that any of a set of compiled group masks
+#   include. Cached by the masks themselves, so changing a group's timing (which recompiles its
+#   mask) or a task's groups gives a new key rather than a stale result.
+@lru_cache(maxsize=FORECAST_CACHE)
+def forecastDays(masks, startOrdinal, numDays) -> tuple:
+    if numDays <= 0:
+        return ()
+    calendar = calendarBits(startOrdinal, numDays)
+    bits = 0
+    for mask in masks:
+        bits |= maskBitsInRange(mask, calendar, startOrdinal, numDays)
+
+    days = []
+    while bits:
+        lowest = bits & -bits
+        days.append(date.fromordinal(startOrdinal + lowest.bit_length() - 1))
+        bits ^= lowest
+    return tuple(days)
+
+# Helper function that checks if a day's value means a task was completed
+def taskCompleted(ttype, value, maxCont) -> bool:
+    if ttype == CONTINUOUS:
+        return value >= maxCont
+    return value > 0
+
+# Helper function that checks a progress value fits a task's type: 0 or 1 for binary tasks, a whole
+#   number from 0 to maxCont for continuous tasks, and any finite number for measured tasks.
+# Raises ValueError otherwise.
+def checkProgress(ttype, value, maxCont) -> None:
+    try:
+        valid = not isinstance(value, bool) and isinstance(value, (int, float)) and abs(float(value)) < float("inf")
+    except OverflowError:
+        valid = False
+    if valid and ttype == BINARY:
+        valid = value in (NO, YES)
+    elif valid and ttype == CONTINUOUS:
+        valid = value == int(value) and 0 <= value <= maxCont
+    if not valid:
+        raise ValueError("Invalid progress value " + repr(value) + " for a task of type " + str(ttype))
+    return
 
-        # Add to today's tasks
-        for t in group.taskPtrs:
-            if t not in tasksToday:
-                tasksToday[t] = 0
+# Helper function that checks a new task's type, and that a continuous task has a positive maxCont.
+# Raises ValueError otherwise.
+def checkTaskType(ttype, maxCont) -> None:
+    if ttype < BINARY or ttype > MEASURED:
+        raise ValueError("task type must be 0, 1, or 2")
+    if ttype == CONTINUOUS and maxCont <= 0:
+        raise ValueError("continuous tasks need a positive maxCont")
+    return
 
+# Helper function that checks a new group's [day, week, month] timing is in the ranges addTask allows.
+# Raises ValueError otherwise.
+def checkTiming(timing) -> None:
+    if not (-6 <= timing[0] <= 127 and -3 <= timing[1] <= 4503599627370495 and -11 <= timing[2] <= 4095):
+        raise ValueError("timing out of range")
     return
 
-# Manipulates the display for today's entry
-def dispEntry() -> None:
+# Helper function that gets the status text of a task for today's entry
+def taskStatus(ttype, value, maxCont) -> str:
+    if ttype == BINARY:
+        if value:
+            return "COMPLETED"
+        return "NOT COMPLETED"
+    elif ttype == CONTINUOUS:
+        if value == maxCont:
+            return "COMPLETED"
+        return str(value) + "/" + str(maxCont)
+    return str(value)
+
+# Helper function that prints today's entry from its status lines
+def printEntry(lines, oneTimeLines, completed, total) -> None:
     indent = "    "
 
     # No tasks for today
-    if len(tasksToday) == 0 and len(oneTimes) == 0:
+    if total == 0:
         print("You have no tasks for today.\n")
         return
 
     # Print out today's recurring tasks in the correct format
     print("RECURRING TASKS:")
-    for t in tasksToday:
-        if allTasks[t].ttype == BINARY:
-            taskStatus = "NOT COMPLETED"
-            if tasksToday[t]:
-                taskStatus = "COMPLETED"
-            print(indent + allTasks[t].keyName + ": " + taskStatus)
-        elif allTasks[t].ttype == CONTINUOUS:
-            if tasksToday[t] == allTasks[t].maxCont:
-                print(indent + allTasks[t].keyName + ": COMPLETED")
-            else:
-                print(indent + allTasks[t].keyName + ": " + str(tasksToday[t]) + "/" +
-                      str(allTasks[t].maxCont))
-        elif allTasks[t].ttype == MEASURED:
-            print(indent + allTasks[t].keyName + ": " + str(tasksToday[t]))
+    for line in lines:
+        print(indent + line)
 
     # Print out today's one-time tasks
     print("\nONE-TIME TASKS:")
-    for ott in oneTimes:
-        if ott.ttype == BINARY:
-            taskStatus = "NOT COMPLETED"
-            if ott.value:
-                taskStatus = "COMPLETED"
-            print(indent + ott.name + ": " + taskStatus)
-        elif ott.ttype == CONTINUOUS:
-            if ott.value == ott.maxCont:
-                print(indent + ott.name + ": COMPLETED")
-            else:
-                print(indent + ott.name + ": " + str(ott.value) + "/" + str(ott.maxCont))
-        elif ott.ttype == MEASURED:
-            print(indent + ott.name + ": " + str(ott.value))
+    for line in oneTimeLines:
+        print(indent + line)
 
-    print()
+    print("\nCompleted " + str(completed) + " of " + str(total) + " tasks today.\n")
     return
 
-# Update all data due to a change in date
-def updateTime(newDate) -> datetime:
-    # Add the items that were last in tasksToday to taskHistory
-    checkedTasks = {}
-    for tKey in tasksToday:
-        checkedTasks[tKey] = True
-
-        tType = allTasks[tKey].ttype
-        if tType == BINARY:  # Binary task
-            # This is used to account for the last date having a negative number (exclusion)
-            addPtr = -2
-            if taskHistory[tKey][-2] < 0:
-                addPtr = -3
-
-            if tasksToday[tKey] == taskHistory[tKey][-1]:
-                taskHistory[tKey][addPtr] += 1
-            else:
-                taskHistory[tKey][-1] = 1
-                taskHistory[tKey].append(abs(tasksToday[tKey] - 1))
-        elif tType == CONTINUOUS or tType == MEASURED:    # Continuous or measured task
-            if taskHistory[tKey][-1] < 0:
-                if taskHistory[tKey][-2] == tasksToday[tKey]:
-                    taskHistory[tKey][-1] -= 1
+# Convert an old list-based taskHistory entry into a TaskHistory that ends the day before endDate.
+# Binary lists are alternating run counts followed by the value of the latest run, with negative
+#   counts for excluded days. Continuous/measured lists are values, where a negative number means
+#   the value before it repeated that many times and a float x.5 means (x + 0.5) excluded days.
+def historyFromList(ttype, oldHistory, endDate) -> TaskHistory:
+    body = list(oldHistory)
+    while body and body[0] == NULL_VAL:
+        body.pop(0)
+
+    runs = []   # (value, days, excluded)
+    if ttype == BINARY:
+        if body:
+            value = body.pop()
+            if value == NULL_VAL:   # No included days yet
+                value = 0
+            # Work backwards from the latest run, flipping the value for each included run
+            for count in reversed(body):
+                if count < 0:
+                    runs.append((0, -count, 1))
                 else:
-                    taskHistory[tKey].append(tasksToday[tKey])
+                    runs.append((value, count, 0))
+                    value = 1 - value
+            runs.reverse()
+    else:
+        for entry in body:
+            if isinstance(entry, float):
+                runs.append((0, int(entry + EXCLUDED_CONT), 1))
+            elif entry < 0 and runs:
+                runs[-1] = (runs[-1][0], -entry, 0)
             else:
-                if taskHistory[tKey][-1] == tasksToday[tKey]:
-                    taskHistory[tKey].append(-2)
-                else:
-                    taskHistory[tKey].append(tasksToday[tKey])
-
-    # Add tasks from oneTimes (for that day) to oneTimeTasks (storage)
-    lastDatesDate = lastDate.date()
-    if lastDatesDate not in oneTimeTasks:
-        oneTimeTasks[lastDatesDate] = []
-    for ott in oneTimes:
-        oneTimeTasks[lastDatesDate].append(ott)
-    oneTimes.clear()
-
-    # Add tasks from that day that were excluded
-    for t in allTasks:
-        if t in checkedTasks:
-            continue
-        checkedTasks[t] = True
+                runs.append((entry, 1, 0))
+
+    newHistory = TaskHistory(0)
+    for value, days, excluded in runs:
+        newHistory.append(value, days, excluded)
+    newHistory.start = toDate(endDate).toordinal() - newHistory.days
+
+    return newHistory
+
+# Helper function that splits the lowest numBits bits of an integer into runs.
+# Yields (bit value, run length) from the lowest bit up.
+def bitRuns(bits, numBits):
+    pos = 0
+    while pos < numBits:
+        rest = bits >> pos
+        if rest & 1:
+            runLen = ((~rest) & (rest + 1)).bit_length() - 1    # Trailing ones
+        elif rest:
+            runLen = (rest & -rest).bit_length() - 1    # Trailing zeros
+        else:
+            runLen = numBits
+        runLen = min(runLen, numBits - pos)
+        yield (rest & 1, runLen)
+        pos += runLen
+
+# Helper function that gets the date ordinal that a day's week (Monday) or month (1st) starts on
+def periodStart(ordinal, timeScale) -> int:
+    if timeScale == WEEK_SCALE:
+        return ordinal - (ordinal - 1) % 7
+    elif timeScale == MONTH_SCALE:
+        return ordinal - date.fromordinal(ordinal).day + 1
+    return ordinal
+
+# Helper function that gets the date ordinal the next period starts on
+def nextPeriod(ordinal, timeScale) -> int:
+    if timeScale == WEEK_SCALE:
+        return ordinal + 7
+    elif timeScale == MONTH_SCALE:
+        d = date.fromordinal(ordinal)
+        return date(d.year + d.month // 12, d.month % 12 + 1, 1).toordinal()
+    return ordinal + 1
+
+# Helper function that gets the stats shown for one point in a graph
+def pointStats(rollup, included, completed, valueSum) -> dict:
+    stats = {"included": included, "completed": completed, "sum": valueSum,
+             "rate": None, "mean": None, "progress": None}
+    if included > 0:
+        stats["rate"] = completed / included
+        stats["mean"] = valueSum / included
+        if rollup.ttype == CONTINUOUS and rollup.maxCont > 0:
+            stats["progress"] = valueSum / (included * rollup.maxCont)
+    return stats
+
+# Helper function that gets the path of a data file in a data directory
+def dataPath(fileName, directory) -> str:
+    return os.path.join(directory, fileName)
+
+# Decorator for Schedule methods that change the schedule data. Each call is recorded in the schedule's
+#   journal after it runs, so the change can be replayed on top of the last snapshot when the data is loaded.
+# NOTE: Only the outermost change should be journaled, and arguments must be picklable.
+def journaled(func):
+    @wraps(func)
+    def wrapper(schedule, *args, **kwargs):
+        if kwargs:
+            # The journal replays changes with positional arguments only
+            import inspect
+
+            bound = inspect.signature(func).bind(schedule, *args, **kwargs)
+            bound.apply_defaults()
+            args = bound.args[1:]
+        with schedule.stateLock:
+            result = func(schedule, *args)
+            schedule.recordChange(func.__name__, args)
+        return result
+
+    journalOps[func.__name__] = func
+    return wrapper
+
+class SaveConflict(Exception):  # Raised when another process wrote to the data directory since this one read it
+    pass
+
+# Hold the data directory's lock file while writing to it, so processes sharing the directory take turns
+# NOTE: The lock isn't reentrant, and it is only taken on systems that have fcntl.
+@contextmanager
+def dataDirLock(directory):
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    with open(dataPath(LOCK_FILE, directory), "a") as lockFile:
+        if fcntl is not None:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+        yield   # Closing the lock file releases the lock
+
+# Helper function that reads the data directory's version stamp (0 if nothing has stamped it yet)
+def readVersion(directory) -> int:
+    try:
+        with open(dataPath(VERSION_FILE, directory)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+# Helper function that makes sure no other process has written to a data directory since this one last
+#   read or wrote it at version (the caller must hold dataDirLock)
+def checkVersion(directory, version) -> None:
+    diskStamp = readVersion(directory)
+    if diskStamp != version:
+        raise SaveConflict("The schedule in " + directory + " was changed by another program (version "
+                           + str(diskStamp) + ", expected " + str(version) + ")")
+    return
 
-        # Add marker for exclusion
-        if allTasks[t].ttype == BINARY:
-            if taskHistory[t][-2] < 0:
-                taskHistory[t][-2] -= 1
-            else:
-                taskHistory[t].append(taskHistory[t][-1])
-                taskHistory[t][-1] = -1
-        elif allTasks[t].ttype == CONTINUOUS or allTasks[t].ttype == MEASURED:
-            if isinstance(taskHistory[t][-1], float):
-                taskHistory[t][-1] += 1
-            else:
-                taskHistory[t].append(EXCLUDED_CONT)
-
-    # Add all incomplete or excluded values for tasks up to today
-    # NOTE: The included tasks needed to be marked first, because there may be a task
-    #       that is in an included group AND an excluded group. If the excluded group
-    #       is processed first, then the task history for that task will be excluded
-    #       instead of marked incomplete.
-    newLastDate = lastDate + timedelta(days=1)
-    while newLastDate < newDate:
-        checkedTasks = {}
-        checkedGroups = {}
-        # Go through groups and add relevant tasks (if included)
-        for group in allGroups:
-            # Check if the date applies to this group
-            include = isGroupIncluded(group.timing, newLastDate, group.included)
+# Helper function that appends journal entries to a data directory through its storage backend and stamps
+#   the directory with the last one. Returns the new version.
+def writeJournal(directory, journalStorage, entries, version) -> int:
+    with dataDirLock(directory):
+        checkVersion(directory, version)
+        journalStorage.appendJournal(entries)
+        writeFilesAtomically({VERSION_FILE: str(entries[-1][0]).encode()}, directory)
+
+    return entries[-1][0]
+
+# Helper function that writes a set of files so that each one is either fully old or fully new
+def writeFilesAtomically(blobs, directory) -> None:
+    for fileName in blobs:
+        with open(dataPath(fileName + ".tmp", directory), "wb") as f:
+            f.write(blobs[fileName])
+            f.flush()
+            os.fsync(f.fileno())
+    for fileName in blobs:
+        os.replace(dataPath(fileName + ".tmp", directory), dataPath(fileName, directory))
+    if metricsEnabled:
+        countMetric("bytes_written", sum(len(blob) for blob in blobs.values()))
+
+    return
+
+# Helper function that gets the name a snapshot file is written under for a generation of snapshots
+#   (e.g. "taskhistory.bin" becomes "taskhistory.3.bin")
+def snapshotFileName(fileName, generation) -> str:
+    stem, ext = fileName.rsplit(".", 1)
+    return stem + "." + str(generation) + "." + ext
+
+# Helper function that gets the generation of a snapshot file's name (None for other files)
+def snapshotGeneration(fileName):
+    parts = fileName.split(".")
+    if len(parts) == 3 and parts[1].isdigit() and parts[0] + "." + parts[2] in SNAPSHOT_FILES:
+        return int(parts[1])
+    return None
+
+class FileStorage:  # Storage backend that keeps snapshots in data files, next to a journal file
+    def __init__(self, directory):
+        self.directory = directory  # Data directory the files are kept in
+
+    # Check if a snapshot has been saved
+    def exists(self) -> bool:
+        return os.path.isfile(dataPath(SNAPSHOT_FILES[-1], self.directory))
+
+    # NOTE: The journal is opened for each write, since another process may have replaced it when compacting
+    def appendJournal(self, entries) -> None:
+        with open(dataPath(JOURNAL_FILE, self.directory), "ab") as f:
+            begin = f.tell()
+            for entry in entries:
+                pickle.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+            if metricsEnabled:
+                countMetric("bytes_written", f.tell() - begin)
+        return
+
+    def readJournal(self):
+        path = dataPath(JOURNAL_FILE, self.directory)
+        if not os.path.isfile(path):
+            return
+
+        goodEnd = 0
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    entry = pickle.load(f)
+                except Exception:   # End of the journal (or a change cut off by a crash)
+                    break
+                goodEnd = f.tell()
+                yield entry
+
+        # Cut off any partly written change so new changes aren't appended after it
+        if goodEnd < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(goodEnd)
+
+        return
+
+    # NOTE: Changes can keep being made while the snapshot files are written, since the data is
+    #       pickled up front and only the entries up to that point are removed from the journal.
+    #       A crash part way leaves the last snapshot in use, since the new files all have new names
+    #       until othervars.pkl is replaced (the caller must hold dataDirLock, so names can't clash).
+    def compact(self, schedule) -> None:
+        generations = [snapshotGeneration(fileName) for fileName in os.listdir(self.directory)]
+        generation = max([g for g in generations if g is not None], default=0) + 1
+        with schedule.stateLock:
+            blobs = schedule.snapshotData(generation)
+            seq = schedule.journalSeq
+        otherVarsData = blobs.pop("othervars.pkl")
+        writeFilesAtomically(blobs, self.directory)
+        writeFilesAtomically({"othervars.pkl": otherVarsData}, self.directory)
+        if hasattr(os, "O_DIRECTORY"):
+            # Make sure the switch to the new snapshot is on disk before the old files are removed
+            dirFile = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            os.fsync(dirFile)
+            os.close(dirFile)
+
+        # Remove the files of earlier snapshots, and any left part way by a crash (files that are still
+        #   memory-mapped stay readable until they are unmapped)
+        for fileName in os.listdir(self.directory):
+            fileGeneration = snapshotGeneration(fileName.removesuffix(".tmp"))
+            if fileName in OLD_SNAPSHOT_FILES or fileName in SNAPSHOT_FILES[:-1] or \
+                    (fileGeneration is not None and (fileGeneration != generation or fileName.endswith(".tmp"))):
+                try:
+                    os.remove(dataPath(fileName, self.directory))
+                except OSError:     # (Files in use can't be removed on some systems, so the next snapshot tries again)
+                    pass
+
+        with schedule.stateLock:
+            schedule.oneTimeTasks.archive(dataPath(snapshotFileName("onetimetasks.bin", generation), self.directory))
+            path = dataPath(JOURNAL_FILE, self.directory)
+            if os.path.isfile(path):
+                # Keep only the changes made after the snapshot was taken
+                with open(path, "rb") as f, open(path + ".tmp", "wb") as out:
+                    while True:
+                        try:
+                            entry = pickle.load(f)
+                        except Exception:
+                            break
+                        if entry[0] > seq:
+                            pickle.dump(entry, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(path + ".tmp", path)
+            schedule.snapshotSeq = seq
+
+        return
+
+    # Task history and past one-time tasks are memory-mapped and only read when they are used
+    @timed("loadSnapshot")
+    def load(self, schedule) -> None:
+
+        # othervars.pkl names the rest of the snapshot's files (older versions used the plain names)
+        f = open(dataPath("othervars.pkl", self.directory), "rb")
+        otherVars = pickle.load(f)
+        f.close()
+        files = otherVars.get("snapshotfiles", {})
+        path = lambda fileName: dataPath(files.get(fileName, fileName), self.directory)
+
+        schedule.taskHistory = HistoryStore()
+        oldHistory = None
+        if os.path.isfile(path("historyindex.pkl")):
+            f = open(path("historyindex.pkl"), "rb")
+            schedule.taskHistory.mapSnapshot(path("taskhistory.bin"), pickle.load(f))
+            f.close()
+        else:
+            f = open(dataPath("taskhistory.pkl", self.directory), "rb")
+            oldHistory = pickle.load(f)
+            f.close()
+        if os.path.isfile(path("onetimeindex.pkl")):
+            f = open(path("onetimeindex.pkl"), "rb")
+            oneTimeIndex = pickle.load(f)
+            f.close()
+            schedule.oneTimeTasks = OneTimeStore()
+            schedule.oneTimeTasks.mapSnapshot(path("onetimetasks.bin"), oneTimeIndex)
+        else:
+            f = open(dataPath("onetimetasks.pkl", self.directory), "rb")
+            oldOneTimes = pickle.load(f)
+            f.close()
+            schedule.oneTimeTasks = OneTimeStore()
+            for day in oldOneTimes:
+                if oldOneTimes[day]:
+                    schedule.oneTimeTasks.add(day, oldOneTimes[day])
+        f = open(path("alltasks.pkl"), "rb")
+        schedule.allTasks = pickle.load(f)
+        f.close()
+        f = open(path("currgraph.pkl"), "rb")
+        schedule.currGraph = pickle.load(f)
+        f.close()
+        f = open(path("taskstoday.pkl"), "rb")
+        schedule.tasksToday = pickle.load(f)
+        f.close()
+
+        schedule.lastDate = otherVars["lastdate"]
+        schedule.otherMedia = otherVars["othermedia"]
+        schedule.allGroups = otherVars["allgroups"]
+        schedule.oneTimes = otherVars["onetimes"]
+        if isinstance(schedule.allGroups, list):
+            schedule.allGroups = upgradeGroups(schedule.allGroups, schedule.allTasks)
+        schedule.snapshotSeq = otherVars.get("journalseq", 0)
+        schedule.journalSeq = schedule.snapshotSeq
+
+        # Convert task history saved by older versions (in the old list-based format)
+        if oldHistory is not None:
+            for t in oldHistory:
+                ttype = schedule.allTasks[t].ttype if t in schedule.allTasks else DELETED_TASK_TYPE
+                schedule.taskHistory.tasks[t] = historyFromList(ttype, oldHistory[t], schedule.lastDate)
+
+        return
+
+    def close(self) -> None:
+        return
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (name TEXT PRIMARY KEY, ttype INTEGER, maxCont REAL, description TEXT,
+                                  displayOpt INTEGER);
+CREATE TABLE IF NOT EXISTS groups (name TEXT PRIMARY KEY, dayTiming INTEGER, weekTiming INTEGER,
+                                   monthTiming INTEGER, included TEXT, rrule TEXT);
+CREATE TABLE IF NOT EXISTS membership (groupName TEXT, taskName TEXT, PRIMARY KEY (groupName, taskName));
+CREATE INDEX IF NOT EXISTS membershipByTask ON membership (taskName);
+CREATE TABLE IF NOT EXISTS history (task TEXT PRIMARY KEY, start INTEGER, days INTEGER);
+CREATE TABLE IF NOT EXISTS historyRuns (task TEXT, seq INTEGER, value REAL, runLen INTEGER, excluded INTEGER,
+                                        PRIMARY KEY (task, seq)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS oneTimeTasks (day TEXT, seq INTEGER, name TEXT, ttype INTEGER, value REAL,
+                                         maxCont REAL, PRIMARY KEY (day, seq)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY, op TEXT, args BLOB);
+"""
+
+class SQLiteStorage:    # Storage backend that keeps the schedule data in an indexed SQLite database
+    def __init__(self, directory):
+        self.directory = directory
+        self.db = None
+
+    # Helper function that opens the database (creating the tables the first time)
+    def connect(self):
+        import sqlite3  # Only needed by data directories that use SQLite
+
+        if self.db is None:
+            self.db = sqlite3.connect(dataPath(SQLITE_FILE, self.directory), check_same_thread=False)
+            self.db.executescript(SQLITE_SCHEMA)
+        return self.db
+
+    def exists(self) -> bool:
+        return self.connect().execute("SELECT 1 FROM state WHERE key = 'lastdate'").fetchone() is not None
+
+    def appendJournal(self, entries) -> None:
+        db = self.connect()
+        rows = [(seq, op, pickle.dumps(args)) for seq, op, args in entries]
+        with db:
+            db.executemany("INSERT INTO journal VALUES (?, ?, ?)", rows)
+        if metricsEnabled:
+            countMetric("bytes_written", sum(len(row[2]) for row in rows))
+        return
+
+    def readJournal(self):
+        rows = self.connect().execute("SELECT seq, op, args FROM journal ORDER BY seq").fetchall()
+        for seq, op, args in rows:
+            yield (seq, op, pickle.loads(args))
+        return
+
+    # Write everything changed since the last snapshot in one transaction. Tasks, groups, and
+    #   membership are small and are rewritten in full, while history and one-time tasks only write
+    #   the tasks/dates that changed (or everything if allData is set).
+    def compact(self, schedule, allData=False) -> None:
+        with schedule.stateLock:
+            db = self.connect()
+            changes = db.total_changes
+            with db:
+                db.execute("DELETE FROM tasks")
+                db.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?)",
+                               ((t.keyName, t.ttype, t.maxCont, t.description, t.displayOpt)
+                                for t in schedule.allTasks.values()))
+                db.execute("DELETE FROM groups")
+                db.executemany("INSERT INTO groups VALUES (?, ?, ?, ?, ?, ?)",
+                               ((g.name, g.timing[0], g.timing[1], g.timing[2], g.included.isoformat(), g.rrule)
+                                for g in schedule.allGroups.values()))
+                db.execute("DELETE FROM membership")
+                db.executemany("INSERT INTO membership VALUES (?, ?)",
+                               ((g.name, t) for g in schedule.allGroups.values() for t in g.taskPtrs))
+
+                for name in list(schedule.taskHistory) if allData else schedule.taskHistory.dirty:
+                    history = schedule.taskHistory[name]
+                    if allData or name in schedule.taskHistory.replaced:
+                        # A new history shares no runs with the saved one
+                        first = 0
+                        db.execute("DELETE FROM historyRuns WHERE task = ?", (name,))
+                    else:
+                        # Rewrite from the last saved run, since it may have been extended since
+                        lastSeq = db.execute("SELECT MAX(seq) FROM historyRuns WHERE task = ?", (name,)).fetchone()[0]
+                        first = 0 if lastSeq is None else max(0, min(lastSeq, len(history.runs)))
+                        db.execute("DELETE FROM historyRuns WHERE task = ? AND seq >= ?", (name, first))
+                    db.executemany("INSERT INTO historyRuns VALUES (?, ?, ?, ?, ?)",
+                                   ((name, i, history.values[i], history.runs[i], history.excluded[i])
+                                    for i in range(first, len(history.runs))))
+                    db.execute("INSERT OR REPLACE INTO history VALUES (?, ?, ?)", (name, history.start, history.days))
+                schedule.taskHistory.dirty.clear()
+                schedule.taskHistory.replaced.clear()
+
+                for day in list(schedule.oneTimeTasks) if allData else schedule.oneTimeTasks.dirty:
+                    otts = schedule.oneTimeTasks[day]
+                    db.execute("DELETE FROM oneTimeTasks WHERE day = ?", (day.isoformat(),))
+                    db.executemany("INSERT INTO oneTimeTasks VALUES (?, ?, ?, ?, ?, ?)",
+                                   ((day.isoformat(), i, ott.name, ott.ttype, ott.value, ott.maxCont)
+                                    for i, ott in enumerate(otts)))
+                schedule.oneTimeTasks.dirty.clear()
+                # The database is the archive of past one-time tasks from now on
+                if allData or schedule.oneTimeTasks.reader is not None:
+                    schedule.oneTimeTasks.dates.clear()
+                    schedule.oneTimeTasks.columns = None
+                    schedule.oneTimeTasks.reader = self.readOneTimes
+
+                state = {"lastdate": schedule.lastDate, "othermedia": schedule.otherMedia,
+                         "onetimes": schedule.oneTimes, "currgraph": schedule.currGraph,
+                         "taskstoday": schedule.tasksToday, "journalseq": schedule.journalSeq}
+                db.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                               ((key, pickle.dumps(state[key])) for key in state))
+                db.execute("DELETE FROM journal WHERE seq <= ?", (schedule.journalSeq,))
+            schedule.snapshotSeq = schedule.journalSeq
+            if metricsEnabled:
+                countMetric("rows_written", db.total_changes - changes)
+
+        return
+
+    # Task history and past one-time tasks are only read from the database when they are used
+    @timed("loadSnapshot")
+    def load(self, schedule) -> None:
+        db = self.connect()
+        state = {key: pickle.loads(value) for key, value in db.execute("SELECT key, value FROM state")}
+        schedule.lastDate = state["lastdate"]
+        schedule.otherMedia = state["othermedia"]
+        schedule.oneTimes = state["onetimes"]
+        schedule.currGraph = state["currgraph"]
+        schedule.tasksToday = state["taskstoday"]
+        schedule.snapshotSeq = state["journalseq"]
+        schedule.journalSeq = schedule.snapshotSeq
+
+        schedule.allTasks = {}
+        for name, ttype, maxCont, description, displayOpt in db.execute("SELECT * FROM tasks"):
+            schedule.allTasks[name] = Task(name, ttype, None, int(maxCont), displayOpt)
+            schedule.allTasks[name].groupPtrs = set()
+            schedule.allTasks[name].description = description
+        schedule.allGroups = {}
+        for name, dayTiming, weekTiming, monthTiming, included, rrule in db.execute("SELECT * FROM groups ORDER BY rowid"):
+            schedule.allGroups[name] = Group(name, dayTiming, weekTiming, monthTiming, datetime.fromisoformat(included),
+                                             rrule)
+        for groupName, taskName in db.execute("SELECT groupName, taskName FROM membership"):
+            schedule.allGroups[groupName].taskPtrs.add(taskName)
+            schedule.allTasks[taskName].groupPtrs.add(groupName)
+
+        schedule.taskHistory = HistoryStore()
+        schedule.taskHistory.mapped = {name: (start, days)
+                                       for name, start, days in db.execute("SELECT * FROM history")}
+        schedule.taskHistory.reader = self.readHistory
+        schedule.oneTimeTasks = OneTimeStore()
+        schedule.oneTimeTasks.reader = self.readOneTimes
+
+        return
+
+    # Read one task's history runs (through the (task, seq) primary key)
+    def readHistory(self, name, location) -> TaskHistory:
+        history = TaskHistory(location[0])
+        rows = self.connect().execute("SELECT value, runLen, excluded FROM historyRuns WHERE task = ? ORDER BY seq",
+                                      (name,))
+        for value, runLen, excluded in rows:
+            history.append(int(value) if value.is_integer() else value, runLen, excluded)
+        return history
+
+    # Read the archived one-time tasks between two day ordinals (through the (day, seq) primary key)
+    def readOneTimes(self, firstOrdinal, lastOrdinal):
+        rows = self.connect().execute("SELECT day, name, ttype, value, maxCont FROM oneTimeTasks "
+                                      "WHERE day BETWEEN ? AND ? ORDER BY day, seq",
+                                      (date.fromordinal(firstOrdinal).isoformat(), date.fromordinal(lastOrdinal).isoformat()))
+        for day, name, ttype, value, maxCont in rows:
+            yield (date.fromisoformat(day).toordinal(), name, ttype, int(value) if value.is_integer() else value,
+                   int(maxCont))
+        return
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        return
+
+# Convert the group list saved by older versions into the name-keyed registry, with task/group
+#   pointers as sets (tasks is the loaded allTasks)
+def upgradeGroups(groupList, tasks) -> dict:
+    groups = {}
+    for group in groupList:
+        group.taskPtrs = set(group.taskPtrs)
+        groups[group.name] = group
+    for task in tasks.values():
+        task.groupPtrs = set(task.groupPtrs)
+    return groups
+
+
+# Read the records of an import file one at a time (CSV with a header row, or JSON Lines)
+def readImportRecords(path):
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value not in ("", None)}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return
+
+# Helper function that turns an import field into a number (ints stay ints)
+def importNumber(value):
+    if isinstance(value, str):
+        value = float(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return value
+
+# Helper function that splits a stream of records into lists of up to size records
+def chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Write export records to an open CSV or JSON Lines file a chunk at a time, returning the number written
+def writeTextExport(records, f, asCSV) -> int:
+    count = 0
+    if asCSV:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+    for chunk in chunked(records, EXPORT_CHUNK):
+        rows = [(date.fromordinal(record[0]).isoformat(),) + record[1:] for record in chunk]
+        if asCSV:
+            writer.writerows(rows)
+        else:
+            f.write("".join(json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows))
+        count += len(chunk)
+    return count
+
+# Write export records to an open binary file as columns, returning the number written.
+# The file is EXPORT_MAGIC, then one block per chunk (the record count, followed by each of EXPORT_COLUMNS
+#   in native byte order), then a JSON list of the task and group names, then the names' offset ('Q').
+def writeColumnarExport(records, f) -> int:
+    count = 0
+    names = {}  # Key = [task or group name]; value = [index in the names list]
+    f.write(EXPORT_MAGIC)
+    for chunk in chunked(records, EXPORT_CHUNK):
+        days, tasks, groups, types, values, excluded = zip(*chunk)
+        columns = (days, [names.setdefault(t, len(names)) for t in tasks],
+                   [names.setdefault(g, len(names)) for g in groups], types, values, excluded)
+        f.write(array('I', [len(chunk)]).tobytes())
+        for (_, code), column in zip(EXPORT_COLUMNS, columns):
+            f.write(array(code, column).tobytes())
+        count += len(chunk)
+    namesOffset = f.tell()
+    f.write(json.dumps(list(names)).encode())
+    f.write(array('Q', [namesOffset]).tobytes())
+    return count
+
+# Read the records of a columnar export file back, a block at a time
+def readColumnarExport(path):
+    with open(path, "rb") as f:
+        if f.read(len(EXPORT_MAGIC)) != EXPORT_MAGIC:
+            raise ValueError("Not a columnar export file: " + path)
+        f.seek(-8, os.SEEK_END)
+        footer = f.tell()
+        namesOffset = array('Q', f.read(8))[0]
+        f.seek(namesOffset)
+        names = json.loads(f.read(footer - namesOffset))
+
+        f.seek(len(EXPORT_MAGIC))
+        while f.tell() < namesOffset:
+            count = array('I', f.read(4))[0]
+            columns = []
+            for _, code in EXPORT_COLUMNS:
+                column = array(code)
+                column.frombytes(f.read(column.itemsize * count))
+                columns.append(column)
+            for day, task, group, ttype, value, excluded in zip(*columns):
+                yield (day, names[task], names[group], ttype, value, excluded)
+
+    return
+
+# Class that holds one schedule (the data saved in one data directory) and the operations that use or change it.
+# Each user of the server has their own, so separate users' requests can run at the same time.
+class Schedule:
+    def __init__(self, dataDir):
+        # -- Schedule data --
+        self.taskHistory = HistoryStore()   # Keeps track of the complete/incomplete,excluded history of all tasks
+        self.lastDate = datetime.today()    # Keeps track of when the app was last opened
+        self.otherMedia = []    # Contains list of file names to additional media saved in SQLite
+        self.allTasks = {}      # Contains all currently created Task objects that have a group
+        self.oneTimeTasks = OneTimeStore()  # Contains the one-time tasks of past days (archived at each snapshot)
+        self.allGroups = {}     # Contains all the current Group objects, keyed by group name
+        self.currGraph = {"dateRange": 0,
+                          "timeScale": 0,
+                          "addedTasks": [],
+                          "dispSettings": []}   # Holds info about the most recent graph created
+
+        # -- Current display data --
+        self.tasksToday = {}    # Key = [task name]; value = [integer for completion]
+                                # (Only includes recurring tasks, not one-time tasks)
+        self.oneTimes = []      # Holds OTTask objects for the current day
+        self.todaySummary = None    # Derived state of today's entry (see getTodaySummary), or None if it needs rebuilding
+
+        # -- Persistence --
+        self.dataDir = dataDir  # Directory that the schedule data files are kept in
+        self.storage = None     # Storage backend in use (see openStorage)
+        self.journalSeq = 0     # Sequence number of the last change recorded in the journal
+        self.snapshotSeq = 0    # Sequence number of the last change included in the saved snapshot
+        self.stateLock = threading.RLock()  # Held while schedule data is being changed or snapshotted
+        self.pendingChanges = []    # Journal entries recorded but not written yet (see flushChanges)
+        self.diskVersion = 0    # Version stamp this schedule last read or wrote (any other stamp means a conflict)
+        self.todayFileExists = True     # Whether TODAY_FILE may still be on disk (the next change removes it)
+        self.writeBehind = False    # Whether changes are left for the background saver to write
+        self.saveLock = threading.RLock()   # Held while this schedule is being written to its data directory
+
+    # Get the days a group will be active on over the next numDays days (starting today, or startDate).
+    # This doesn't change any schedule data.
+    def forecastGroup(self, groupName, numDays=FORECAST_DAYS, startDate=None) -> tuple:
+        start = toDate(self.lastDate if startDate is None else startDate)
+        return forecastDays((groupMask(self.allGroups[groupName]),), start.toordinal(), numDays)
+
+    # Get the days a task will be due on (any of its groups is active) over the next numDays days
+    def forecastTask(self, taskName, numDays=FORECAST_DAYS, startDate=None) -> tuple:
+        start = toDate(self.lastDate if startDate is None else startDate)
+        masks = frozenset(groupMask(self.allGroups[groupName]) for groupName in self.allTasks[taskName].groupPtrs)
+        return forecastDays(masks, start.toordinal(), numDays)
+
+    # Fill the tasksToday list with the tasks that apply today
+    @timed("getTodaysTasks")
+    def getTodaysTasks(self, newDate) -> None:
+        self.resetTodaySummary()
+        if metricsEnabled:
+            countMetric("groups_evaluated", len(self.allGroups))
+
+        # Look in groups for repeating tasks
+        for group in self.allGroups.values():
+            # Check if this group is valid
+            include = maskIncludes(groupMask(group), newDate)
             if not include:
                 continue
-            group.included = newLastDate
+            group.included = newDate    # Update included date for this group
 
-            # Mark that this group has been checked
-            checkedGroups[group.name] = True
+            # Add to today's tasks
             for t in group.taskPtrs:
-                if t in checkedTasks:
-                    continue
-                checkedTasks[t] = True
+                if t not in self.tasksToday:
+                    self.tasksToday[t] = 0
 
-                # Mark task as incomplete in task history
-                if allTasks[t].ttype == BINARY:
-                    # Again accounting for excluded entries
-                    addPtr = -2
-                    if taskHistory[t][-2] < 0:
-                        addPtr = -3
+        return
 
-                    if taskHistory[t][-1] == 0:
-                        taskHistory[t][addPtr] += 1
-                    else:
-                        taskHistory[t][-1] = 1
-                        taskHistory[t].append(0)
-                elif allTasks[t].ttype == CONTINUOUS or allTasks[t].ttype == MEASURED:
-                    if taskHistory[t][-1] < 0:
-                        if taskHistory[t][-2] == 0:
-                            taskHistory[t][-1] -= 1
-                        else:
-                            taskHistory[t].append(0)
-                    else:
-                        if taskHistory[t][-1] == 0:
-                            taskHistory[t].append(-2)
-                        else:
-                            taskHistory[t].append(0)
-
-        # Go through the groups and add relevant tasks (for excluded)
-        checkedTasks = {}
-        for group in allGroups:
-            if checkedGroups[group.name]:
+    # Helper function that gets a task's streak up to yesterday. Uses the task's rollup if it has one, and
+    #   otherwise only reads back through its history as far as the streak goes.
+    def currentStreak(self, taskName) -> int:
+        rollup = self.taskHistory.rollups.get(taskName)
+        if rollup is not None:
+            return rollup.currentStreak
+
+        task = self.allTasks[taskName]
+        history = self.taskHistory[taskName]
+        streak = 0
+        for i in range(len(history.runs) - 1, -1, -1):
+            if history.excluded[i]:
                 continue
+            if not taskCompleted(task.ttype, history.values[i], task.maxCont):
+                break
+            streak += history.runs[i]
+        return streak
+
+    # Get the derived state of today's entry, building it if today's tasks have changed since it was
+    #   last used. Marking a task keeps it up to date, so this is O(1) between changes to today's tasks.
+    def getTodaySummary(self) -> TodaySummary:
+        if self.todaySummary is None:
+            self.todaySummary = TodaySummary(self)
+        return self.todaySummary
+
+    # Helper function that drops the derived state of today's entry after today's tasks change
+    def resetTodaySummary(self) -> None:
+        self.todaySummary = None
+        return
 
+    # Add the incomplete or excluded history for all tasks over a range of days nobody opened the app.
+    # Each task's days are worked out together, so the cost depends on the number of runs in the range
+    #   rather than days x groups x tasks.
+    @timed("backfillHistory")
+    def backfillHistory(self, startDate, numDays) -> None:
+        if numDays <= 0:
+            return
+        if metricsEnabled:
+            countMetric("days_backfilled", numDays)
+            countMetric("groups_evaluated", len(self.allGroups))
+
+        # A task is included on a day if any of its groups are, so a task that is in an included group
+        #   AND an excluded group gets marked incomplete rather than excluded.
+        activeBits = groupsActiveInRange(self.allGroups.values(), startDate, numDays)
+        taskBits = dict.fromkeys(self.allTasks, 0)
+        for group in self.allGroups.values():
+            bits = activeBits[group.name]
+            if not bits:
+                continue
+            group.included = startDate + timedelta(days=bits.bit_length() - 1)
             for t in group.taskPtrs:
-                if t in checkedTasks:
+                if t in taskBits:
+                    taskBits[t] |= bits
+
+        for t in taskBits:
+            for included, runLen in bitRuns(taskBits[t], numDays):
+                if included:
+                    self.taskHistory.append(t, 0, runLen)
+                else:
+                    self.taskHistory.exclude(t, runLen)
+
+        return
+
+    # Update all data due to a change in date
+    @timed("updateTime")
+    def updateTime(self, newDate) -> datetime:
+        # Add the items that were last in tasksToday to taskHistory
+        for tKey in self.tasksToday:
+            self.taskHistory.append(tKey, self.tasksToday[tKey])
+
+        # Add tasks from oneTimes (for that day) to oneTimeTasks (storage)
+        lastDatesDate = self.lastDate.date()
+        if self.oneTimes:
+            self.oneTimeTasks.add(lastDatesDate, self.oneTimes)
+        self.oneTimes.clear()
+
+        # Add tasks from that day that were excluded
+        for t in self.allTasks:
+            if t not in self.tasksToday:
+                self.taskHistory.exclude(t)
+        self.tasksToday.clear()
+        self.resetTodaySummary()
+
+        # Add all incomplete or excluded values for the days in between
+        gapDays = (toDate(newDate) - lastDatesDate).days - 1
+        self.backfillHistory(self.lastDate + timedelta(days=1), gapDays)
+
+        return newDate
+
+    # Get the rollup of a task, building it from the task's history the first time
+    def getRollup(self, taskName) -> TaskRollup:
+        rollup = self.taskHistory.rollups.get(taskName)
+        if rollup is None:
+            task = self.allTasks.get(taskName)
+            if task is None:    # Deleted task (only its history is left)
+                rollup = TaskRollup(DELETED_TASK_TYPE, -1)
+            else:
+                rollup = TaskRollup(task.ttype, task.maxCont)
+
+            history = self.taskHistory[taskName]
+            ordinal = history.start
+            for i in range(len(history.runs)):
+                rollup.addRun(ordinal, history.values[i], history.runs[i], history.excluded[i])
+                ordinal += history.runs[i]
+            self.taskHistory.rollups[taskName] = rollup
+
+        return rollup
+
+    # Get the history index of a task, building it from the task's history the first time
+    def getHistoryIndex(self, taskName) -> HistoryIndex:
+        index = self.taskHistory.indexes.get(taskName)
+        if index is None:
+            task = self.allTasks.get(taskName)
+            if task is None:    # Deleted task (only its history is left)
+                index = HistoryIndex(self.taskHistory[taskName], DELETED_TASK_TYPE, -1)
+            else:
+                index = HistoryIndex(self.taskHistory[taskName], task.ttype, task.maxCont)
+            self.taskHistory.indexes[taskName] = index
+
+        return index
+
+    # Look up one day in a task's history. Returns None for days outside the recorded history.
+    def historyDay(self, taskName, day):
+        index = self.getHistoryIndex(taskName)
+        offset = toDate(day).toordinal() - index.history.start
+        if offset < 0 or offset >= index.history.days:
+            return None
+
+        i = index.runAt(offset)
+        value = index.history.values[i]
+        excluded = bool(index.history.excluded[i])
+        return {"date": toDate(day), "value": value, "excluded": excluded,
+                "completed": not excluded and taskCompleted(index.ttype, value, index.maxCont)}
+
+    # Get the totals of a task's history between two dates (inclusive, limited to the recorded days)
+    #   in the same form as a graph point
+    def historyRange(self, taskName, startDate, endDate) -> dict:
+        index = self.getHistoryIndex(taskName)
+        first = max(0, toDate(startDate).toordinal() - index.history.start)
+        last = min(index.history.days, toDate(endDate).toordinal() - index.history.start + 1)
+        if last <= first:
+            return pointStats(index, 0, 0, 0)
+
+        before = index.totals(first)
+        through = index.totals(last)
+        return pointStats(index, through[0] - before[0], through[1] - before[1], through[2] - before[2])
+
+    # Get the graph data for a set of tasks over the last dateRange recorded days (up to yesterday).
+    # Week and month points come straight from the cached rollups (whole weeks/months, so the first one
+    #   may start before the range), and day points come from the history runs in the range.
+    def graphData(self, taskNames, dateRange, timeScale) -> dict:
+        lastOrdinal = toDate(self.lastDate).toordinal() - 1
+        firstOrdinal = lastOrdinal - dateRange + 1
+
+        graph = {}
+        for name in taskNames:
+            if name not in self.taskHistory:
+                continue
+            rollup = self.getRollup(name)
+            points = []
+
+            if timeScale == DAY_SCALE:
+                # Walk back from the latest run until the start of the range
+                history = self.taskHistory[name]
+                runEnd = history.start + history.days
+                i = len(history.runs) - 1
+                while i >= 0 and runEnd > firstOrdinal:
+                    runStart = runEnd - history.runs[i]
+                    included = 1 - history.excluded[i]
+                    completed = int(bool(included) and rollup.isCompleted(history.values[i]))
+                    for ordinal in range(min(runEnd, lastOrdinal + 1) - 1, max(runStart, firstOrdinal) - 1, -1):
+                        points.append((date.fromordinal(ordinal),
+                                       pointStats(rollup, included, completed, history.values[i] * included)))
+                    runEnd = runStart
+                    i -= 1
+                points.reverse()
+            else:
+                buckets = rollup.weeks if timeScale == WEEK_SCALE else rollup.months
+                ordinal = periodStart(firstOrdinal, timeScale)
+                while ordinal <= lastOrdinal:
+                    bucket = buckets.get(ordinal, (0, 0, 0))
+                    points.append((date.fromordinal(ordinal), pointStats(rollup, bucket[0], bucket[1], bucket[2])))
+                    ordinal = nextPeriod(ordinal, timeScale)
+
+            graph[name] = {"points": points, "currentStreak": rollup.currentStreak,
+                           "longestStreak": rollup.longestStreak}
+
+        return graph
+
+    # Get the graph data for the settings in currGraph
+    def buildGraph(self) -> dict:
+        return self.graphData(self.currGraph["addedTasks"], self.currGraph["dateRange"], self.currGraph["timeScale"])
+
+    # Append a change to the journal. This only writes the change itself, so it costs O(change).
+    # With writeBehind set, the change is left for the background saver to write along with the others
+    #   made since its last write.
+    def recordChange(self, op, args) -> None:
+        self.journalSeq += 1
+        self.pendingChanges.append((self.journalSeq, op, args))
+
+        # The today snapshot no longer matches the data
+        if self.todayFileExists:
+            if os.path.isfile(dataPath(TODAY_FILE, self.dataDir)):
+                os.remove(dataPath(TODAY_FILE, self.dataDir))
+            self.todayFileExists = False
+
+        if not self.writeBehind:
+            self.flushChanges()
+
+        return
+
+    # Write the pending changes to the journal in one write, then fold a long journal into a new snapshot.
+    # Raises SaveConflict (keeping the changes pending) if another process has written to the data directory.
+    def flushChanges(self) -> None:
+        with self.saveLock:
+            with self.stateLock:
+                entries = list(self.pendingChanges)
+            if entries:
+                version = writeJournal(self.dataDir, self.openStorage(), entries, self.diskVersion)
+                with self.stateLock:
+                    self.diskVersion = version
+                    del self.pendingChanges[:len(entries)]
+
+            if self.journalSeq - self.snapshotSeq >= COMPACT_AFTER:
+                self.compactJournal()
+
+        return
+
+    # Helper function that stamps the data directory with the last change this process wrote to it
+    def stampVersion(self, seq) -> None:
+        writeFilesAtomically({VERSION_FILE: str(seq).encode()}, self.dataDir)
+        self.diskVersion = seq
+        return
+
+    # Replay the changes in the journal that are newer than the loaded snapshot
+    @timed("replayJournal")
+    def replayJournal(self) -> None:
+        for seq, op, args in self.openStorage().readJournal():
+            if seq > self.journalSeq:
+                try:
+                    journalOps[op](self, *args)
+                except ValueError as e:     # Saved before such changes were rejected (e.g. a bad progress value)
+                    print("Skipped change", seq, "(" + op + "):", e, file=sys.stderr)
+                self.journalSeq = seq
+
+        return
+
+    # Write a new snapshot and drop the journal entries that it now includes
+    @timed("compactJournal")
+    def compactJournal(self) -> None:
+        with self.saveLock:
+            with dataDirLock(self.dataDir):
+                checkVersion(self.dataDir, self.diskVersion)
+                self.openStorage().compact(self)
+                self.stampVersion(self.snapshotSeq)
+
+            # The snapshot already includes any changes still waiting to be written
+            with self.stateLock:
+                self.pendingChanges[:] = [entry for entry in self.pendingChanges if entry[0] > self.snapshotSeq]
+
+        return
+
+    # Reload the data another process saved, then redo the changes this process hadn't written on top of it.
+    # Returns the names of the changes that no longer apply (e.g. their task was deleted by the other process).
+    def rebaseChanges(self) -> list:
+        failed = []
+        with self.saveLock, self.stateLock:
+            entries = list(self.pendingChanges)
+            self.pendingChanges.clear()
+            self.loadData()
+            for seq, op, args in entries:
+                try:
+                    journalOps[op](self, *args)
+                except (KeyError, ValueError, IndexError):
+                    failed.append(op)
                     continue
-                checkedTasks[t] = True
+                self.journalSeq += 1
+                self.pendingChanges.append((self.journalSeq, op, args))
+
+        return failed
+
+    # Pickle all the schedule data for a snapshot (the caller must hold stateLock).
+    # The files other than othervars.pkl are keyed by the names they are written under for the generation.
+    def snapshotData(self, generation) -> dict:
+        files = {fileName: snapshotFileName(fileName, generation) for fileName in SNAPSHOT_FILES[:-1]}
+        otherVars = {"lastdate": self.lastDate, "othermedia": self.otherMedia, "allgroups": self.allGroups,
+                     "onetimes": self.oneTimes, "journalseq": self.journalSeq, "snapshotfiles": files}
+        historyData, historyIndex = self.taskHistory.snapshot()
+        oneTimeData, oneTimeIndex = self.oneTimeTasks.snapshot()
+        return {files["taskhistory.bin"]: historyData,
+                files["historyindex.pkl"]: pickle.dumps(historyIndex),
+                files["onetimetasks.bin"]: oneTimeData,
+                files["onetimeindex.pkl"]: pickle.dumps(oneTimeIndex),
+                files["alltasks.pkl"]: pickle.dumps(self.allTasks),
+                files["currgraph.pkl"]: pickle.dumps(self.currGraph),
+                files["taskstoday.pkl"]: pickle.dumps(self.tasksToday),
+                "othervars.pkl": pickle.dumps(otherVars)}
+
+    # Get the storage backend for the data directory, picking SQLite if it already has a database
+    def openStorage(self):
+        if self.storage is None:
+            if storageType == "sqlite" or os.path.isfile(dataPath(SQLITE_FILE, self.dataDir)):
+                self.storage = SQLiteStorage(self.dataDir)
+            else:
+                self.storage = FileStorage(self.dataDir)
+        return self.storage
+
+    # Move the schedule data in the data directory from the data files into a SQLite database
+    def migrateToSQLite(self) -> None:
+        self.storage = FileStorage(self.dataDir)
+        self.loadData()
+        newStorage = SQLiteStorage(self.dataDir)
+        newStorage.compact(self, True)
+        self.storage.close()
+        self.storage = newStorage
 
-                # Mark as excluded in task history
-                if allTasks[t].ttype == BINARY:
-                    if taskHistory[t][-2] < 0:
-                        taskHistory[t][-2] -= 1
-                    else:
-                        taskHistory[t].append(taskHistory[t][-1])
-                        taskHistory[t][-1] = -1
-                elif allTasks[t].ttype == CONTINUOUS or allTasks[t].ttype == MEASURED:
-                    if isinstance(taskHistory[t][-1], float):
-                        taskHistory[t][-1] += 1
-                    else:
-                        taskHistory[t].append(EXCLUDED_CONT)
+        return
+
+    # Get the names of the groups that include a task
+    def groupsOf(self, taskName) -> set:
+        return self.allTasks[taskName].groupPtrs
+
+    # Helper function that links a task and a group in both directions
+    def linkTask(self, group, taskName) -> None:
+        group.taskPtrs.add(taskName)
+        self.allTasks[taskName].groupPtrs.add(group.name)
+        return
+
+    # Helper function that unlinks a task and a group, deleting the group if it is left empty
+    def unlinkTask(self, group, taskName) -> None:
+        group.taskPtrs.discard(taskName)
+        self.allTasks[taskName].groupPtrs.discard(group.name)
+        if len(group.taskPtrs) == 0:
+            del self.allGroups[group.name]
+        return
+
+    # Move to a new day: record the days since the app was last opened and get today's tasks.
+    # Does nothing if the schedule is already on that day (e.g. when rebaseChanges redoes a rollover that
+    #   another process already saved).
+    @timed("rollover")
+    @journaled
+    def rollover(self, currDate) -> None:
+        if self.lastDate.date() >= currDate.date():
+            return
+        self.lastDate = self.updateTime(currDate)
+        self.getTodaysTasks(currDate)
+
+        return
+
+    # Create a task in an existing group, or in a new group if a timing (and optionally a recurrence rule)
+    #   is given
+    @journaled
+    def createTask(self, taskName, taskType, maxCont, currDate, groupName, timing=None, rrule=None) -> None:
+        if timing is None:
+            group = self.allGroups[groupName]
+        else:
+            group = Group(groupName, timing[0], timing[1], timing[2], currDate, rrule)
+            self.allGroups[groupName] = group
+            self.tasksToday[taskName] = 0
+
+        self.allTasks[taskName] = Task(taskName, taskType, groupName, maxCont)
+        self.linkTask(group, taskName)
+        self.taskHistory.create(taskName, currDate)
+        self.resetTodaySummary()
+
+        return
+
+    # Create a one-time task for today
+    @journaled
+    def createOneTimeTask(self, taskName, taskType, maxCont) -> None:
+        self.oneTimes.append(OTTask(taskName, taskType, maxCont))
+        self.resetTodaySummary()
+        return
+
+    # Delete a task, along with any of its groups that would be left empty (its history is kept)
+    @journaled
+    def removeTask(self, taskName) -> None:
+        for grpName in list(self.allTasks[taskName].groupPtrs):
+            self.unlinkTask(self.allGroups[grpName], taskName)
+        del self.allTasks[taskName]
+        self.tasksToday.pop(taskName, None)
+        self.resetTodaySummary()
+
+        return
+
+    # Take a task out of one of its groups, deleting the group if it is left empty.
+    # A task can't be taken out of its only group (it would be left with no groups), so that raises ValueError.
+    @journaled
+    def removeTaskFromGroup(self, groupName, taskName) -> None:
+        if self.allTasks[taskName].groupPtrs == {groupName}:
+            raise ValueError(taskName + " is only in " + groupName + ", so it can't be removed from it")
+        self.unlinkTask(self.allGroups[groupName], taskName)
+        return
+
+    # Add an existing task to another existing group
+    @journaled
+    def addTaskToGroup(self, groupName, taskName) -> None:
+        self.linkTask(self.allGroups[groupName], taskName)
+        return
+
+    # Move a task from one group to another, deleting the old group if it is left empty
+    @journaled
+    def moveTask(self, taskName, fromGroup, toGroup) -> None:
+        if fromGroup == toGroup:
+            raise ValueError(taskName + " can't be moved to the group it is already in")
+        self.linkTask(self.allGroups[toGroup], taskName)
+        self.unlinkTask(self.allGroups[fromGroup], taskName)
+        return
+
+    # Set the progress value of one of today's tasks (recurring or one-time)
+    @journaled
+    def setProgress(self, taskName, value) -> None:
+        if taskName in self.tasksToday:
+            checkProgress(self.allTasks[taskName].ttype, value, self.allTasks[taskName].maxCont)
+            self.tasksToday[taskName] = value
+            if self.todaySummary is not None:
+                self.todaySummary.markRecurring(taskName, value)
+            return
+        for i in range(len(self.oneTimes)):
+            if self.oneTimes[i].name == taskName:
+                checkProgress(self.oneTimes[i].ttype, value, self.oneTimes[i].maxCont)
+                self.oneTimes[i].value = value
+                if self.todaySummary is not None:
+                    self.todaySummary.markOneTime(i)
+                return
+        raise KeyError(taskName)
+
+    # Save the data before the program ends.
+    # Every change is already in the journal, so this only writes a snapshot the first time (or
+    #   finishes one being written in the background) and closes the storage backend.
+    @timed("saveData")
+    def saveData(self) -> None:
+        self.flushChanges()
+        if not self.openStorage().exists():
+            self.compactJournal()
+
+        with self.stateLock:
+            self.writeTodaySnapshot()
+            self.openStorage().close()
+
+        return
+
+    # Save the small "today" snapshot: today's entry as it is displayed, so the next start can show it
+    #   before the rest of the data has loaded
+    def writeTodaySnapshot(self) -> None:
+        summary = self.getTodaySummary()
+        todayData = {"lastdate": self.lastDate, "lines": list(summary.lines.values()),
+                     "onetimelines": summary.oneTimeLines, "completed": summary.completedCount,
+                     "total": summary.taskCount()}
+        writeFilesAtomically({TODAY_FILE: pickle.dumps(todayData)}, self.dataDir)
+        self.todayFileExists = True
+        return
+
+    # Read the today snapshot, if there is one that is still up to date for currDate
+    def readTodaySnapshot(self, currDate):
+        try:
+            with open(dataPath(TODAY_FILE, self.dataDir), "rb") as f:
+                todayData = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if todayData["lastdate"].date() != currDate.date():
+            return None
+        return todayData
+
+    # Retrieve all the stored data from the last snapshot, then replay the journal on top of it
+    # NOTE: This function assumes the data exists
+    @timed("loadData")
+    def loadData(self) -> None:
+        self.resetTodaySummary()
+        with dataDirLock(self.dataDir):
+            self.diskVersion = readVersion(self.dataDir)
+            self.openStorage().load(self)
+            self.replayJournal()
+
+        return
+
+    # Check a batch of import records and add them to the staged import. Records are one of:
+    #   group:   name, day, week, month (the same timing values as addTask)
+    #   task:    name, type, maxCont (for CONTINUOUS tasks), group
+    #   member:  group, task (adds a task to another group)
+    #   history: task, date, value, days (default 1), excluded (default 0)
+    def stageImportBatch(self, batch, firstRecord, staged) -> None:
+        for i in range(len(batch)):
+            record = batch[i]
+            try:
+                kind = record["kind"]
+                if kind == "group":
+                    name = str(record["name"])
+                    timing = [int(importNumber(record.get(key, 0))) for key in ("day", "week", "month")]
+                    checkTiming(timing)
+                    if name in self.allGroups or name in staged["groups"]:
+                        raise ValueError("group " + name + " already exists")
+                    rrule = record.get("rrule")
+                    staged["groups"][name] = timing + [None if rrule is None else anchorRule(str(rrule), self.lastDate)]
+                elif kind == "task":
+                    name = str(record["name"])
+                    taskType = int(importNumber(record["type"]))
+                    maxCont = int(importNumber(record.get("maxCont", -1)))
+                    checkTaskType(taskType, maxCont)
+                    if name in self.allTasks or name in staged["tasks"]:
+                        raise ValueError("task " + name + " already exists")
+                    staged["tasks"][name] = (taskType, maxCont, str(record["group"]))
+                elif kind == "member":
+                    staged["members"].append((str(record["group"]), str(record["task"])))
+                elif kind == "history":
+                    excluded = str(record.get("excluded", 0)).lower() in ("1", "true", "yes")
+                    days = int(importNumber(record.get("days", 1)))
+                    if days < 1:
+                        raise ValueError("days must be at least 1")
+                    value = 0 if excluded else importNumber(record["value"])
+                    staged["history"].setdefault(str(record["task"]), []).append(
+                        (date.fromisoformat(str(record["date"])).toordinal(), days, value, int(excluded)))
+                else:
+                    raise ValueError("unknown kind " + repr(kind))
+            except (KeyError, ValueError, TypeError) as e:
+                if isinstance(e, KeyError):
+                    e = "missing field " + str(e)
+                raise ValueError("Import record " + str(firstRecord + i) + ": " + str(e))
+
+        return
+
+    # Helper function that builds the TaskHistory of an imported task from its history records. Days
+    #   without a record are excluded, and the history is filled in up to yesterday like every other task.
+    # Each value is checked against the task's type and maxCont (see checkProgress), since the task's record
+    #   may come after its history in the file.
+    def buildImportedHistory(self, name, records, ttype, maxCont) -> TaskHistory:
+        records.sort()
+        lastOrdinal = toDate(self.lastDate).toordinal()
+        history = TaskHistory(records[0][0])
+        for ordinal, days, value, excluded in records:
+            nextOrdinal = history.start + history.days
+            if ordinal < nextOrdinal:
+                raise ValueError("Import history for " + name + " overlaps on " + date.fromordinal(ordinal).isoformat())
+            if ordinal + days > lastOrdinal:
+                raise ValueError("Import history for " + name + " goes past yesterday")
+            if not excluded:
+                try:
+                    checkProgress(ttype, value, maxCont)
+                except ValueError as e:
+                    raise ValueError("Import history for " + name + " on " + date.fromordinal(ordinal).isoformat()
+                                     + ": " + str(e))
+            if ordinal > nextOrdinal:
+                history.append(0, ordinal - nextOrdinal, 1)
+            history.append(value, days, excluded)
+        if history.start + history.days < lastOrdinal:
+            history.append(0, lastOrdinal - history.start - history.days, 1)
+        return history
+
+    # Import tasks, groups, membership, and history from a CSV or JSON Lines file.
+    # Records are streamed and checked in batches, and nothing is changed unless the whole file is
+    #   valid. Everything imported is then saved together in one new snapshot.
+    def importData(self, path) -> dict:
+        staged = {"groups": {}, "tasks": {}, "members": [], "history": {}}
+        records = readImportRecords(path)
+        numRecords = 0
+        while True:
+            batch = list(islice(records, IMPORT_BATCH))
+            if len(batch) == 0:
+                break
+            self.stageImportBatch(batch, numRecords + 1, staged)
+            numRecords += len(batch)
+
+        # saveLock is taken first, as the background saver does, since the import ends with a compaction
+        with self.saveLock, self.stateLock:
+            # Check references between records (and the existing schedule)
+            for name in staged["tasks"]:
+                groupName = staged["tasks"][name][2]
+                if groupName not in self.allGroups and groupName not in staged["groups"]:
+                    raise ValueError("Import task " + name + " is in unknown group " + groupName)
+            for groupName, taskName in staged["members"]:
+                if groupName not in self.allGroups and groupName not in staged["groups"]:
+                    raise ValueError("Import membership uses unknown group " + groupName)
+                if taskName not in self.allTasks and taskName not in staged["tasks"]:
+                    raise ValueError("Import membership uses unknown task " + taskName)
+            histories = {}
+            for name in staged["history"]:
+                if name not in staged["tasks"]:
+                    raise ValueError("Import history is only allowed for tasks created by the import: " + name)
+                taskType, maxCont = staged["tasks"][name][:2]
+                histories[name] = self.buildImportedHistory(name, staged["history"][name], taskType, maxCont)
+
+            # Apply the import
+            for groupName in staged["groups"]:
+                timing = staged["groups"][groupName]
+                self.allGroups[groupName] = Group(groupName, timing[0], timing[1], timing[2], self.lastDate, timing[3])
+            for name in staged["tasks"]:
+                taskType, maxCont, groupName = staged["tasks"][name]
+                self.allTasks[name] = Task(name, taskType, groupName, maxCont)
+                self.linkTask(self.allGroups[groupName], name)
+                if name in histories:
+                    self.taskHistory.mapped.pop(name, None)
+                    self.taskHistory.tasks[name] = histories[name]
+                    self.taskHistory.dirty.add(name)
+                    self.taskHistory.replaced.add(name)
+                    self.taskHistory.rollups.pop(name, None)
+                    self.taskHistory.indexes.pop(name, None)
+                else:
+                    self.taskHistory.create(name, self.lastDate)
+            for groupName, taskName in staged["members"]:
+                self.linkTask(self.allGroups[groupName], taskName)
+
+            # Imported tasks that are in a group active today go in today's entry
+            for name in staged["tasks"]:
+                for groupName in self.allTasks[name].groupPtrs:
+                    if maskIncludes(groupMask(self.allGroups[groupName]), self.lastDate):
+                        self.tasksToday.setdefault(name, 0)
+            self.resetTodaySummary()
+
+            self.compactJournal()
+
+        return {"records": numRecords, "groups": len(staged["groups"]), "tasks": len(staged["tasks"]),
+                "members": len(staged["members"]), "history": sum(len(r) for r in staged["history"].values())}
+
+    # Decode the task history (and past one-time tasks) between two day ordinals into one record per task
+    #   per day: (date ordinal, task, groups, type, value, excluded). Tasks in more than one group list them
+    #   separated by ";", and one-time tasks have no group. Only the tasks in taskNames are included, if it is
+    #   given.
+    # NOTE: Each task's history is read and dropped in turn, so memory doesn't grow with the history.
+    def exportRecords(self, firstOrdinal, lastOrdinal, taskNames=None):
+        for name in self.taskHistory:
+            if taskNames is not None and name not in taskNames:
+                continue
+            task = self.allTasks.get(name)
+            ttype = task.ttype if task is not None else DELETED_TASK_TYPE  # (Deleted tasks keep their history)
+            groups = ";".join(sorted(task.groupPtrs)) if task is not None else ""
+
+            history = self.taskHistory.peek(name)
+            ordinal = history.start
+            for value, runLen, excluded in zip(history.values, history.runs, history.excluded):
+                if ordinal > lastOrdinal:
+                    break
+                if isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                for day in range(max(ordinal, firstOrdinal), min(ordinal + runLen - 1, lastOrdinal) + 1):
+                    yield (day, name, groups, ttype, value, excluded)
+                ordinal += runLen
+
+        for ordinal, name, ttype, value, maxCont in self.oneTimeTasks.rows(firstOrdinal, lastOrdinal):
+            if taskNames is None or name in taskNames:
+                yield (ordinal, name, "", ttype, value, 0)
+
+        return
+
+    # Export the task history (and past one-time tasks) to a file, with one record per task per day.
+    # The file type comes from its extension: .csv, .jsonl, or .bin (columnar). Records can be limited to a
+    #   range of dates (inclusive) and to a set of task names. Returns the number of records written.
+    @timed("exportData")
+    def exportData(self, path, startDate=None, endDate=None, taskNames=None) -> int:
+        firstOrdinal = 1 if startDate is None else toDate(startDate).toordinal()
+        lastOrdinal = date.max.toordinal() if endDate is None else toDate(endDate).toordinal()
+        records = self.exportRecords(firstOrdinal, lastOrdinal, None if taskNames is None else set(taskNames))
+
+        if path.endswith(".bin"):
+            with open(path, "wb") as f:
+                count = writeColumnarExport(records, f)
+        elif path.endswith(".csv") or path.endswith(".jsonl"):
+            with open(path, "w", newline="") as f:
+                count = writeTextExport(records, f, path.endswith(".csv"))
+        else:
+            raise ValueError("Export files must end in .csv, .jsonl, or .bin: " + path)
+
+        if metricsEnabled:
+            countMetric("records_exported", count)
+        return count
 
-        # Update the last date by a day until it reaches the current date
-        newLastDate = newLastDate + timedelta(days=1)
+    # Helper function that loads the saved schedule (or saves a new one) and moves it to today
+    def openSchedule(self) -> None:
+        os.makedirs(self.dataDir, exist_ok=True)
+        if self.openStorage().exists():
+            self.loadData()
+        else:
+            self.saveData()
+        self.catchUpSchedule()
+        return
+
+    # Helper function that reloads the schedule if another process saved it, and moves it to today if the day
+    #   has changed
+    def catchUpSchedule(self) -> None:
+        if readVersion(self.dataDir) != self.diskVersion:
+            self.loadData()
+        currDate = datetime.today()
+        if self.lastDate.date() < currDate.date():
+            self.rollover(currDate)
+        return
+
+    # Get today's entry as JSON-ready data
+    def todaysEntry(self) -> dict:
+        summary = self.getTodaySummary()
+        recurring = [{"name": t, "type": self.allTasks[t].ttype, "value": self.tasksToday[t],
+                      "maxCont": self.allTasks[t].maxCont,
+                      "status": taskStatus(self.allTasks[t].ttype, self.tasksToday[t], self.allTasks[t].maxCont),
+                      "completed": t in summary.completed, "streak": summary.streak(t)} for t in self.tasksToday]
+        oneTime = [{"name": ott.name, "type": ott.ttype, "value": ott.value, "maxCont": ott.maxCont,
+                    "status": taskStatus(ott.ttype, ott.value, ott.maxCont)} for ott in self.oneTimes]
+        return {"date": self.lastDate.date().isoformat(), "recurring": recurring, "oneTime": oneTime,
+                "completed": summary.completedCount, "total": summary.taskCount()}
+
+    # Add a task from a JSON request body
+    def addTaskRequest(self, body) -> dict:
+        name = body["name"]
+        taskType = int(body["type"])
+        maxCont = int(body.get("maxCont", -1))
+        checkTaskType(taskType, maxCont)
+        if body.get("oneTime"):
+            self.createOneTimeTask(name, taskType, maxCont)
+            return {"created": name}
+
+        if name in self.allTasks:
+            raise ValueError("A task with that name already exists")
+        timing = body.get("timing")
+        if timing is None and body["group"] not in self.allGroups:
+            raise KeyError(body["group"])
+        if timing is not None:
+            if body["group"] in self.allGroups or len(timing) != 3:
+                raise ValueError("New groups need an unused name and a [day, week, month] timing")
+            timing = [int(value) for value in timing]
+            checkTiming(timing)
+        self.createTask(name, taskType, maxCont, datetime.today(), body["group"], timing, body.get("rrule"))
+        return {"created": name}
+
+    # Delete a task (for a request)
+    def deleteTaskRequest(self, name) -> dict:
+        if name not in self.allTasks:
+            raise KeyError(name)
+        self.removeTask(name)
+        return {"deleted": name}
+
+    # Mark progress on one of today's tasks (for a request)
+    def markTaskRequest(self, name, body) -> dict:
+        self.setProgress(name, body["value"])
+        return {"marked": name, "value": body["value"]}
+
+    # Get graph data for a request (using currGraph for anything not given)
+    def graphRequest(self, query) -> dict:
+        names = query["tasks"].split(",") if "tasks" in query else self.currGraph["addedTasks"]
+        dateRange = int(query.get("range", self.currGraph["dateRange"]))
+        timeScale = int(query.get("scale", self.currGraph["timeScale"]))
+        return self.graphData(names, dateRange, timeScale)
+
+    # Get one day (query: date) or the totals of a date range (query: start, end) of a task's history
+    def historyRequest(self, name, query) -> dict:
+        if name not in self.taskHistory:
+            raise KeyError(name)
+        if "date" in query:
+            day = self.historyDay(name, date.fromisoformat(query["date"]))
+            if day is None:
+                raise KeyError(query["date"])
+            return day
+        return self.historyRange(name, date.fromisoformat(query["start"]), date.fromisoformat(query["end"]))
+
+    # Get the upcoming due dates of every task (query: days)
+    def forecastRequest(self, query) -> dict:
+        numDays = int(query.get("days", FORECAST_DAYS))
+        if numDays < 0 or numDays > 3660:
+            raise ValueError("days must be between 0 and 3660")
+        return {"start": self.lastDate.date().isoformat(),
+                "tasks": {t: [day.isoformat() for day in self.forecastTask(t, numDays)] for t in self.allTasks}}
+
+    # Helper function that moves the schedule to currDate and folds the change into its snapshot.
+    # Returns whether the day had changed.
+    def rolloverSchedule(self, currDate) -> bool:
+        self.loadData()
+        rolled = self.lastDate.date() < currDate.date()
+        if rolled:
+            self.rollover(currDate)
+            self.compactJournal()
+        self.saveData()
+        return rolled
+
+# Manipulates the display for today's entry
+@timed("dispEntry")
+def dispEntry() -> None:
+    summary = schedule.getTodaySummary()
+    printEntry(summary.lines.values(), summary.oneTimeLines, summary.completedCount, summary.taskCount())
+    return
+
+# Background saver: writes the pending changes every SAVE_INTERVAL seconds until it is stopped, so
+#   saving never holds up the menu. A conflict is left for the menu to resolve (see resolveConflict).
+def saverLoop() -> None:
+    global saveConflict
+
+    while not saverStop.wait(SAVE_INTERVAL):
+        if saveConflict is not None:
+            continue
+        try:
+            schedule.flushChanges()
+        except SaveConflict as e:
+            saveConflict = e
+        except OSError as e:    # Tried again next time
+            print("Could not save your changes:", e, file=sys.stderr)
 
-    return newLastDate
+    return
+
+# Start writing changes on the background saver instead of as they are made
+def startSaver() -> None:
+    global saverThread
+
+    schedule.writeBehind = True
+    saverStop.clear()
+    saverThread = threading.Thread(target=saverLoop, daemon=True)
+    saverThread.start()
+    return
+
+# Stop the background saver. Changes still pending are written by the next change or saveData.
+def stopSaver() -> None:
+    global saverThread
+
+    if saverThread is not None:
+        saverStop.set()
+        saverThread.join()
+        saverThread = None
+    schedule.writeBehind = False
+    return
+
+# Helper function that rebases the unsaved changes if the background saver found a conflict
+def resolveConflict() -> None:
+    global saveConflict
+
+    if saveConflict is None:
+        return
+    print(str(saveConflict) + ". Reloading it and redoing your unsaved changes...")
+    failed = schedule.rebaseChanges()
+    saveConflict = None
+    if failed:
+        print("These changes no longer apply and were dropped:", ", ".join(failed))
+    return
 
 # Add a new task
+@timed("addTask")
 def addTask(currDate) -> None:
     # Get general info for this new task
     nameExists = True
     taskName = ""
     while nameExists == True:
         taskName = input("What name do you want for this task? (Don't choose an existing name)\n")
-        if taskName not in allTasks:
+        if taskName not in schedule.allTasks:
             nameExists = False
 
     taskType = -1
@@ -312,11 +2519,11 @@ def addTask(currDate) -> None:
 
     # Create OTT if applicable
     if isOTT == 'Y':
-        oneTimes.append(OTTask(taskName, taskType, thisMaxCont))
+        schedule.createOneTimeTask(taskName, taskType, thisMaxCont)
         return
 
     # Check if an older, deleted task with that name is already in taskHistory
-    if taskName in taskHistory:
+    if taskName in schedule.taskHistory:
         print("A task with that name has existed before in Task History.")
         overwrite = input("Would you like to overwrite that history completely with this new task?\n")
         if overwrite == 'N':
@@ -326,20 +2533,19 @@ def addTask(currDate) -> None:
     addToGroup = False
     addToGroup = int(input("Would you like add this to a group? Otherwise a new group will be created. (1 for Yes, 0 for No)\n"))
     if addToGroup == True:
-        if len(allGroups) == 0:
+        if len(schedule.allGroups) == 0:
             print("You have no groups to add to.\n")
             return
 
+        groupNames = list(schedule.allGroups)
         print("All Groups:\n")
-        for i in range(0, len(allGroups)):
-            print("    " + str(i) + ":", allGroups[i].name, "\n")
+        for i in range(0, len(groupNames)):
+            print("    " + str(i) + ":", groupNames[i], "\n")
 
         groupID = -1
-        while (groupID < 0) or (groupID >= len(allGroups)):
+        while (groupID < 0) or (groupID >= len(groupNames)):
             groupID = int(input("Which group would you like to add it to? (Enter the value)\n"))
-        allGroups[groupID].taskPtrs.append(taskName)
-        allTasks[taskName] = Task(taskName, taskType, allGroups[groupID].name, thisMaxCont)
-        taskHistory[taskName] = [NULL_VAL, NULL_VAL, NULL_VAL]
+        schedule.createTask(taskName, taskType, thisMaxCont, currDate, groupNames[groupID])
 
         return
 
@@ -348,10 +2554,7 @@ def addTask(currDate) -> None:
     groupName = ""
     while nameExists == True:
         groupName = input("What name do you want for this group? (Don't choose an existing name)\n")
-        nameExists = False
-        for grp in allGroups:
-            if groupName == grp.name:
-                nameExists = True
+        nameExists = groupName in schedule.allGroups
 
     print("Now you need to set the timing of this group task for the day, week, and month.")
     print("Enter a 0 for this task to happen every time period, a positive number for specific points in this time period (represented by bits), or a negative number to skip a certain time period value.")
@@ -365,23 +2568,33 @@ def addTask(currDate) -> None:
     while (monthTiming < -11) or (monthTiming > 4095):
         monthTiming = int(input("Timing for month:\n"))
 
-    allGroups.append(Group(groupName, dayTiming, weekTiming, monthTiming, currDate))
-    allGroups[-1].taskPtrs.append(taskName)
-    allTasks[taskName] = Task(taskName, taskType, groupName, thisMaxCont)
-    tasksToday[taskName] = 0
-    taskHistory[taskName] = [NULL_VAL, NULL_VAL, NULL_VAL]
+    # The group can also follow an iCalendar recurrence rule (on top of the timing above)
+    rrule = None
+    while True:
+        rrule = input("Recurrence rule (e.g. 'FREQ=MONTHLY;BYDAY=2TU' or 'FREQ=DAILY;INTERVAL=3'), or leave blank for none:\n").strip() or None
+        if rrule is None:
+            break
+        try:
+            anchorRule(rrule, currDate)
+            break
+        except ValueError as e:
+            print(e)
+
+    schedule.createTask(taskName, taskType, thisMaxCont, currDate, groupName, [dayTiming, weekTiming, monthTiming],
+                        rrule)
 
     return
 
 # Delete an existing task
+@timed("deleteTask")
 def deleteTask() -> None:
     deleteName = input("Enter the name of the task you would like to delete.\n")
-    if deleteName not in allTasks:
+    if deleteName not in schedule.allTasks:
         print("This task does not exist. Try again.")
         return
 
-    for grp in allTasks[deleteName].groupPtrs:
-        if len(allGroups[grp].taskPtrs) <= 1:
+    for grp in schedule.allTasks[deleteName].groupPtrs:
+        if len(schedule.allGroups[grp].taskPtrs) <= 1:
             print("This will delete the group known as:", grp)
             deleteGroup = input("Is that okay?\n")
 
@@ -389,98 +2602,370 @@ def deleteTask() -> None:
             if deleteGroup == "N":
                 return
 
-    for grp in allTasks[deleteName].groupPtrs:
-        del allGroups[grp]
-    del allTasks[deleteName]
+    schedule.removeTask(deleteName)
 
     return
 
 # Remove an existing task from an existing group
+@timed("removeFromGroup")
 def removeFromGroup() -> None:
     removeGroup = input("Enter the name of the group you want to remove a task from.\n")
-    if removeGroup not in allGroups:
+    if removeGroup not in schedule.allGroups:
         print("This group does not exist. Try again.")
         return
 
     removeName = input("Enter the name of the task you would like to remove.\n")
-    if removeName not in allGroups[removeGroup].taskPtrs:
+    if removeName not in schedule.allGroups[removeGroup].taskPtrs:
         print("This task is not in this group. Try again.")
         return
 
     # Check if this is the only group this task is in. If so, redirect to deleteTask function.
-    if len(allTasks[removeName].groupPtrs) <= 1:
+    if len(schedule.allTasks[removeName].groupPtrs) <= 1:
         print("This will delete the task, since it exists in only one group.")
         print("Use the 'Delete Task' function instead.")
         return
 
-    if len(allGroups[removeGroup].taskPtrs) <= 1:
+    if len(schedule.allGroups[removeGroup].taskPtrs) <= 1:
         deleteGroup = input("This will delete the group. Is that okay?\n")
-        if deleteGroup == "Y":
-            del allGroups[removeGroup]
-        else:
+        if deleteGroup != "Y":
             return
 
-    # TODO: Remove task from *allGroups[removeGroup].taskPtrs*. Difficult since it is an array.
+    schedule.removeTaskFromGroup(removeGroup, removeName)
+
     return
 
 # Mark the progress on one of today's tasks
+@timed("markTask")
 def markTask() -> None:
-    # TODO
+    if len(schedule.tasksToday) == 0 and len(schedule.oneTimes) == 0:
+        print("You have no tasks for today.\n")
+        return
+
+    markName = input("Enter the name of the task you would like to mark.\n")
+    if markName in schedule.tasksToday:
+        ttype = schedule.allTasks[markName].ttype
+        maxCont = schedule.allTasks[markName].maxCont
+    else:
+        otts = [ott for ott in schedule.oneTimes if ott.name == markName]
+        if len(otts) == 0:
+            print("This task is not in today's entry. Try again.")
+            return
+        ttype = otts[0].ttype
+        maxCont = otts[0].maxCont
+
+    # Get the new value in the way that fits the task's type
+    if ttype == BINARY:
+        done = input("Did you complete this task? (Answer 'Y' for Yes and 'N' for No)\n")
+        value = YES if done == 'Y' else NO
+    elif ttype == CONTINUOUS:
+        value = -1
+        while (value < 0) or (value > maxCont):
+            value = int(input("How many out of " + str(maxCont) + " have you done?\n"))
+    else:
+        value = float(input("What value would you like to record for today?\n"))
+        if value.is_integer():
+            value = int(value)
+
+    schedule.setProgress(markName, value)
+
+    summary = schedule.getTodaySummary()
+    if markName in summary.lines:
+        print(summary.lines[markName])
+    print("Completed " + str(summary.completedCount) + " of " + str(summary.taskCount()) + " tasks today.\n")
     return
 
-# Save the data before the program ends using Pickle
-def saveData() -> None:
-    global otherVars
-
-    with open("taskhistory.pkl", 'wb') as f:
-        pickle.dump(taskHistory, f)
-    with open("alltasks.pkl", 'wb') as f:
-        pickle.dump(allTasks, f)
-    with open("onetimetasks.pkl", 'wb') as f:
-        pickle.dump(oneTimeTasks, f)
-    with open("currgraph.pkl", 'wb') as f:
-        pickle.dump(currGraph, f)
-    with open("taskstoday.pkl", 'wb') as f:
-        pickle.dump(tasksToday, f)
-
-    otherVars = {"lastdate": lastDate, "othermedia": otherMedia, "allgroups": allGroups, "onetimes": oneTimes}
-    with open("othervars.pkl", 'wb') as f:
-        pickle.dump(otherVars, f)
+# Load the data and catch up to currDate (run on startupThread so the menu can show right away)
+def startUp(currDate) -> None:
+    global startupError
+
+    try:
+        # Check if this program is being run for the first time before loading data
+        # NOTE: Files will already be initialized in app version
+        if not schedule.openStorage().exists():
+            schedule.saveData()
+        schedule.loadData()
+
+        # Update any data that needs to be updated based on date
+        if schedule.lastDate.date() < currDate.date():
+            schedule.rollover(currDate)
+    except Exception as e:
+        startupError = e
 
     return
 
-# Retrieve all the stored data from Pickle file
-# NOTE: This function assumes the files exist
-def loadData() -> None:
-    global taskHistory, allTasks, oneTimeTasks, currGraph, tasksToday, otherVars, lastDate, otherMedia, \
-            allGroups, oneTimes
-
-    f = open("taskhistory.pkl", "rb")
-    taskHistory = pickle.load(f)
-    f.close()
-    f = open("alltasks.pkl", "rb")
-    allTasks = pickle.load(f)
-    f.close()
-    f = open("onetimetasks.pkl", "rb")
-    oneTimeTasks = pickle.load(f)
-    f.close()
-    f = open("currgraph.pkl", "rb")
-    currGraph = pickle.load(f)
-    f.close()
-    f = open("taskstoday.pkl", "rb")
-    tasksToday = pickle.load(f)
-    f.close()
-
-    f = open("othervars.pkl", "rb")
-    otherVars = pickle.load(f)
-    f.close()
-    lastDate = otherVars["lastdate"]
-    otherMedia = otherVars["othermedia"]
-    allGroups = otherVars["allgroups"]
-    oneTimes = otherVars["onetimes"]
+# Wait for the data to finish loading at startup
+def waitForStartup() -> None:
+    if startupThread is not None:
+        startupThread.join()
+    if startupError is not None:
+        raise startupError
+    return
 
+# Record the time from launch to the first menu, and warn if it went over the budget
+def trackStartup() -> None:
+    seconds = time.perf_counter() - launchTime
+    if metricsEnabled:
+        recordTime("timeToFirstMenu", seconds)
+    if seconds > STARTUP_BUDGET:
+        print("Startup took %d ms (budget %d ms)" % (seconds * 1000, STARTUP_BUDGET * 1000), file=sys.stderr)
     return
 
+# The server below runs on asyncio (the interactive program doesn't use it)
+import asyncio
+
+# Helper function that decodes a URL query string into a dict (the last value wins for repeated keys)
+def parseQuery(queryString) -> dict:
+    from urllib.parse import parse_qsl
+
+    return dict(parse_qsl(queryString, keep_blank_values=True))
+
+# Class that holds one user's schedule in the server, along with what the server needs to share it between requests
+class UserSchedule:
+    def __init__(self, userDir):
+        self.schedule = Schedule(userDir)
+        self.lock = asyncio.Lock()  # Held while a request for this user is being handled
+        self.requests = 0           # Number of requests using this schedule (it isn't dropped from memory while any are)
+        self.opened = False         # Whether the saved schedule has been loaded
+
+class ScheduleServer:   # Class that serves many users' schedules over a local JSON-over-HTTP API
+    def __init__(self, rootDir, maxUsers=SERVER_MAX_USERS):
+        self.rootDir = rootDir
+        self.maxUsers = maxUsers
+        self.users = {}     # Key = [user id]; value = [UserSchedule], from least to most recently used
+        self.saving = {}    # Key = [user id]; value = [future] saving a schedule that was dropped from memory
+
+    # Get a user's schedule, counting the request that uses it (the caller must take it back off user.requests)
+    async def getUser(self, userId) -> UserSchedule:
+        if not userId.replace("-", "").replace("_", "").isalnum():
+            raise ValueError("Invalid user id")
+
+        # A schedule that was just dropped from memory is only loaded again once it has been saved
+        while userId in self.saving:
+            await asyncio.shield(self.saving[userId])
+        user = self.users.pop(userId, None)
+        if user is None:
+            user = UserSchedule(os.path.join(self.rootDir, USERS_DIR, userId))
+        self.users[userId] = user
+        user.requests += 1
+
+        # Save and drop the least recently used schedules that aren't busy
+        for oldId in list(self.users):
+            if len(self.users) <= self.maxUsers:
+                break
+            oldUser = self.users.get(oldId)
+            if oldUser is not None and oldUser.requests == 0:
+                del self.users[oldId]
+                saving = asyncio.get_running_loop().run_in_executor(None, self.saveUser, oldId, oldUser.schedule)
+                self.saving[oldId] = saving
+                saving.add_done_callback(lambda future, oldId=oldId: self.saving.pop(oldId, None))
+                await asyncio.shield(saving)
+
+        return user
+
+    # Save a schedule that is being dropped from memory. If another process saved it in the meantime, its
+    #   unsaved changes are redone on top of that, so the request that made room for another schedule
+    #   doesn't fail.
+    def saveUser(self, userId, schedule) -> None:
+        try:
+            try:
+                schedule.saveData()
+            except SaveConflict:
+                failed = schedule.rebaseChanges()
+                if failed:
+                    print("Dropped changes for " + userId + " that no longer apply:", ", ".join(failed), file=sys.stderr)
+                schedule.saveData()
+        except (SaveConflict, OSError) as e:
+            print("Could not save the schedule for " + userId + ":", e, file=sys.stderr)
+        return
+
+    # Load a user's schedule (or catch it up to today and to other processes' changes), then run func on it
+    # NOTE: This runs on a worker thread, so a slow load or save doesn't hold up other users' requests.
+    def runRequest(self, user, func, args):
+        if user.opened:
+            user.schedule.catchUpSchedule()
+        else:
+            user.schedule.openSchedule()
+            user.opened = True
+        return func(user.schedule, *args)
+
+    # Run a request against a user's schedule. Returns (HTTP status, JSON-ready response).
+    async def handle(self, method, path, query, body):
+        from urllib.parse import unquote
+
+        # Split before decoding, so an encoded "/" stays part of a name
+        parts = [unquote(part) for part in path.split("/") if part]
+        if method == "GET" and parts == ["metrics"]:
+            return (200, metricsSummary())
+        if len(parts) < 3 or parts[0] != "users":
+            return (404, {"error": "Unknown path"})
+
+        route = (method, parts[2], len(parts))
+        if route == ("GET", "today", 3):
+            status, func, args = 200, Schedule.todaysEntry, ()
+        elif route == ("POST", "tasks", 3):
+            status, func, args = 201, Schedule.addTaskRequest, (body,)
+        elif route == ("DELETE", "tasks", 4):
+            status, func, args = 200, Schedule.deleteTaskRequest, (parts[3],)
+        elif route == ("POST", "tasks", 5) and parts[4] == "mark":
+            status, func, args = 200, Schedule.markTaskRequest, (parts[3], body)
+        elif route == ("GET", "graph", 3):
+            status, func, args = 200, Schedule.graphRequest, (query,)
+        elif route == ("GET", "history", 4):
+            status, func, args = 200, Schedule.historyRequest, (parts[3], query)
+        elif route == ("GET", "forecast", 3):
+            status, func, args = 200, Schedule.forecastRequest, (query,)
+        else:
+            return (404, {"error": "Unknown path"})
+
+        user = None
+        try:
+            user = await self.getUser(parts[1])
+            async with user.lock:
+                return (status, await asyncio.get_running_loop().run_in_executor(None, self.runRequest, user, func, args))
+        except KeyError as e:
+            return (404, {"error": "Not found: " + str(e)})
+        except (ValueError, TypeError) as e:
+            return (400, {"error": str(e)})
+        except SaveConflict as e:
+            # The copy in memory has a change the data directory doesn't, so it is reloaded on the next request
+            if self.users.get(parts[1]) is user:
+                del self.users[parts[1]]
+            return (409, {"error": str(e)})
+        finally:
+            if user is not None:
+                user.requests -= 1
+
+    # Handle the HTTP requests on one connection (kept open between requests)
+    async def serveConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, target = requestLine.decode("latin-1").split()[:2]
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                path, _, queryString = target.partition("?")
+                query = parseQuery(queryString)
+                length = int(headers.get("content-length", 0))
+                try:
+                    body = json.loads(await reader.readexactly(length)) if length else {}
+                    status, response = await self.handle(method, path, query, body)
+                except json.JSONDecodeError:
+                    status, response = (400, {"error": "Invalid JSON"})
+
+                data = json.dumps(response, default=str).encode()
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                              % (status, "OK" if status < 300 else "Error", len(data))).encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Save every schedule still in memory
+    def saveAll(self) -> None:
+        while self.users:
+            userId, user = self.users.popitem()
+            self.saveUser(userId, user.schedule)
+        return
+
+# Run the schedule server until it is stopped
+async def serveSchedules(rootDir, host="127.0.0.1", port=SERVER_PORT) -> None:
+    server = ScheduleServer(rootDir)
+    listener = await asyncio.start_server(server.serveConnection, host, port)
+    print("Serving schedules on " + host + ":" + str(port))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.saveAll()
+
+    return
+
+# Find the schedule data directories under a root directory (any directory holding a saved schedule)
+def findScheduleDirs(rootDir) -> list:
+    found = []
+    for entry in sorted(os.scandir(rootDir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        if os.path.isfile(os.path.join(entry.path, SNAPSHOT_FILES[-1])) or \
+                os.path.isfile(os.path.join(entry.path, SQLITE_FILE)):
+            found.append(entry.path)
+        else:
+            found.extend(findScheduleDirs(entry.path))
+    return found
+
+# Roll one schedule data directory over to currDate (run in a worker process).
+# The rollover is journaled before it is folded into a new snapshot, so a directory is either fully
+#   rolled over or not at all if the worker is stopped part way.
+# Returns (directory, seconds taken, error or None, whether the day had changed).
+def rolloverDirectory(userDir, currDate) -> tuple:
+    begin = time.perf_counter()
+    try:
+        rolled = Schedule(userDir).rolloverSchedule(currDate)
+        return (userDir, time.perf_counter() - begin, None, rolled)
+    except Exception as e:
+        return (userDir, time.perf_counter() - begin, repr(e), False)
+
+# Helper function that gets the directories already rolled over to a date by an earlier (stopped) batch
+def readRolloverProgress(path, day) -> set:
+    done = set()
+    if not os.path.isfile(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # Torn last line from an interrupted batch
+            if entry["date"] == day and entry["error"] is None:
+                done.add(entry["dir"])
+    return done
+
+# Roll every schedule under rootDir over to currDate in a pool of worker processes.
+# Finished directories are logged to ROLLOVER_PROGRESS_FILE as they complete, so running the batch
+#   again after an interruption skips them. Returns a report with per-directory timings and failures.
+def rolloverAll(rootDir, currDate, workers=None) -> dict:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    day = currDate.date().isoformat()
+    progressPath = os.path.join(rootDir, ROLLOVER_PROGRESS_FILE)
+    done = readRolloverProgress(progressPath, day)
+    if not done and os.path.isfile(progressPath):
+        os.remove(progressPath)     # Progress from an earlier day's batch
+    pending = [userDir for userDir in findScheduleDirs(rootDir) if userDir not in done]
+
+    timings = {}
+    failures = {}
+    rolled = 0
+    begin = time.perf_counter()
+    with open(progressPath, "a") as progress, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(rolloverDirectory, userDir, currDate) for userDir in pending]
+        for future in as_completed(futures):
+            userDir, seconds, error, changed = future.result()
+            timings[userDir] = seconds
+            if error is not None:
+                failures[userDir] = error
+            rolled += changed
+            progress.write(json.dumps({"dir": userDir, "date": day, "seconds": seconds, "error": error}) + "\n")
+            progress.flush()
+
+    ordered = sorted(timings.values())
+    return {"date": day, "skipped": len(done), "processed": len(timings), "rolled": rolled, "failures": failures,
+            "seconds": time.perf_counter() - begin,
+            "p50": ordered[len(ordered) // 2] if ordered else None,
+            "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None,
+            "slowest": sorted(timings.items(), key=lambda item: -item[1])[:ROLLOVER_REPORT_SLOWEST]}
+
 
 #----- MAIN -----
 # Test the functions for Schedule
@@ -493,34 +2978,105 @@ if __name__ == '__main__':
     quit()
     '''
 
-    # Check if this program is being run for the first time before loading data
-    # NOTE: Files will already be initialized in app version
-    if not os.path.isfile("taskhistory.pkl") or not os.access("taskhistory.pkl", os.R_OK):
-        print("HERE")
-        saveData()
-    loadData()
-
-    # Update any data that needs to be updated based on date
+    # Record operation timers and counters if asked to, writing them to a file when the program ends
+    if "--metrics" in sys.argv:
+        metricsEnabled = True
+        metricsPath = dataPath("metrics.json", dataDir)
+        nextArg = sys.argv.index("--metrics") + 1
+        if nextArg < len(sys.argv) and not sys.argv[nextArg].startswith("--"):
+            metricsPath = os.path.abspath(sys.argv[nextArg])
+        atexit.register(writeMetrics, metricsPath)
+
+    # Use the SQLite storage backend if asked to (moving over any data saved in data files)
+    schedule = Schedule(dataDir)
+    if "--sqlite" in sys.argv:
+        storageType = "sqlite"
+        if FileStorage(dataDir).exists() and not os.path.isfile(dataPath(SQLITE_FILE, dataDir)):
+            schedule.migrateToSQLite()
+
+    # Roll every schedule under a directory over to today if asked to (e.g. as a nightly job)
+    if "--rollover-all" in sys.argv:
+        workers = None
+        if "--workers" in sys.argv:
+            workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        report = rolloverAll(sys.argv[sys.argv.index("--rollover-all") + 1], datetime.today(), workers)
+        print("Rolled over", report["rolled"], "of", report["processed"], "schedules in %.1fs" % report["seconds"],
+              "(" + str(report["skipped"]) + " already done, p50 %s s, p95 %s s)" % (report["p50"], report["p95"]))
+        for userDir, seconds in report["slowest"]:
+            print("   %8.3f s  %s" % (seconds, userDir))
+        for userDir in report["failures"]:
+            print("    FAILED", userDir + ":", report["failures"][userDir])
+        sys.exit(1 if report["failures"] else 0)
+
+    # Run as a server for many users' schedules if asked to
+    if "--serve" in sys.argv:
+        port = SERVER_PORT
+        if "--port" in sys.argv:
+            port = int(sys.argv[sys.argv.index("--port") + 1])
+        try:
+            asyncio.run(serveSchedules(dataDir, port=port))
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    # Save changes in the background, so the menu never waits on a write
+    startSaver()
+
+    # Load the data in the background. Until it is ready, today's entry is shown from the today snapshot.
     currDate = datetime.today()
-    if lastDate.date() < currDate.date():
-        lastDate = updateTime(currDate)
-        getTodaysTasks(currDate)
+    todayData = schedule.readTodaySnapshot(currDate)
+    startupThread = threading.Thread(target=startUp, args=(currDate,))
+    startupThread.start()
+
+    # Bulk import a file instead of running the menu if asked to
+    if "--import" in sys.argv:
+        waitForStartup()
+        result = schedule.importData(sys.argv[sys.argv.index("--import") + 1])
+        print("Imported", result["records"], "records:", result)
+        schedule.saveData()
+        sys.exit()
+
+    # Export the task history instead of running the menu if asked to
+    if "--export" in sys.argv:
+        exportFrom = exportTo = exportTasks = None
+        if "--from" in sys.argv:
+            exportFrom = date.fromisoformat(sys.argv[sys.argv.index("--from") + 1])
+        if "--to" in sys.argv:
+            exportTo = date.fromisoformat(sys.argv[sys.argv.index("--to") + 1])
+        if "--tasks" in sys.argv:
+            exportTasks = sys.argv[sys.argv.index("--tasks") + 1].split(",")
+        waitForStartup()
+        exportPath = sys.argv[sys.argv.index("--export") + 1]
+        print("Exported", schedule.exportData(exportPath, exportFrom, exportTo, exportTasks), "records to", exportPath)
+        schedule.saveData()
+        sys.exit()
 
     running = True
+    firstMenu = True
     while running:
         # Print the menu and receive an input
         menu = {"q": "Quit",
                 "t": "Today's Entry",
                 "a": "Add a Task",
                 "c": "Mark a Task's Progress",
-                "d": "Delete a Task,"
-                "r": "Remove a Task from a Group"
+                "d": "Delete a Task",
+                "r": "Remove a Task from a Group",
                 "x": "Debug"}
         print("Welcome to your schedule app.\nMenu:")
         for key in menu:
             print("   ", key, "-", menu[key])
+        if firstMenu:
+            trackStartup()
+            firstMenu = False
         choice = input("Which function would you like to try?\n")
 
+        # Today's entry can be shown from the today snapshot, but everything else needs the full data
+        if choice == "t" and todayData is not None and startupThread.is_alive():
+            printEntry(todayData["lines"], todayData["onetimelines"], todayData["completed"], todayData["total"])
+            continue
+        waitForStartup()
+        resolveConflict()
+
         # Choose the appropriate case
         if choice == "q":   # Quit the app
             running = False
@@ -535,10 +3091,16 @@ if __name__ == '__main__':
         elif choice == "r":
             removeFromGroup()   # Removes a task from a group
         elif choice == "x":
-            for t in tasksToday:
-                print(allTasks[t].ttype)
-            print(allTasks)
-    # Save the data
-    saveData()
+            for t in schedule.tasksToday:
+                print(schedule.allTasks[t].ttype)
+            print(schedule.allTasks)
+    # Save the data (redoing the unsaved changes first if another program saved in the meantime)
+    stopSaver()
+    try:
+        schedule.saveData()
+    except SaveConflict as e:
+        saveConflict = e
+        resolveConflict()
+        schedule.saveData()
 
     print("The program has ended.")
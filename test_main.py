@@ -0,0 +1,503 @@
+# Tests for the Schedule application's core
+#
+# Usage: python -m pytest test_main.py
+
+from datetime import datetime, date, timedelta
+import threading
+import random
+import csv
+import json
+import asyncio
+import pytest
+import main
+
+#----- FUNCTIONS -----
+# Helper function that drops a schedule's data from memory and loads it back from its data directory
+def reloadSchedule(schedule) -> None:
+    schedule.openStorage().close()
+    schedule.storage = None
+    schedule.loadData()
+    return
+
+# Helper function that checks a date against a group timing the way isGroupIncluded did before timings were
+#   compiled into masks (one date at a time, straight from the timing bits)
+def oldIsGroupIncluded(groupTiming, dateCheck, dateIncl) -> bool:
+    include = True
+    if groupTiming[2] > 0 and include:
+        include = (groupTiming[2] >> (12 - dateCheck.date().month)) & 1
+    elif groupTiming[2] < 0 and include:
+        include = ((dateCheck.date().month - dateIncl.month) % abs(groupTiming[2])) == 0
+
+    weekNum = dateCheck.isocalendar()[1]
+    if groupTiming[1] > 0 and include:
+        include = (groupTiming[1] >> (52 - weekNum)) & 1
+    elif groupTiming[1] < 0 and include:
+        include = ((weekNum - dateIncl.isocalendar()[1]) % abs(groupTiming[1])) == 0
+
+    weekDay = dateCheck.weekday()
+    if groupTiming[0] > 0 and include:
+        include = (groupTiming[0] >> (6 - weekDay)) & 1
+    elif groupTiming[0] < 0 and include:
+        include = (abs(weekDay - dateIncl.weekday()) % abs(groupTiming[0])) == 0
+
+    return bool(include)
+
+#----- TESTS -----
+# Compiled group masks include the same dates as the old date-by-date check, for every kind of timing
+#   (ISO week 53 is skipped for week bitmaps, which the old check couldn't handle)
+def test_compiled_masks_match_old_check():
+    rng = random.Random(1)
+    timings = [[0, 0, 0], [-6, 0, 0], [0, -3, 0], [0, 0, -11], [127, 4503599627370495, 4095]]
+    for _ in range(200):
+        timings.append([rng.choice([0, rng.randrange(1, 128), -rng.randrange(1, 7)]),
+                        rng.choice([0, rng.randrange(1, 1 << 52), -rng.randrange(1, 4)]),
+                        rng.choice([0, rng.randrange(1, 4096), -rng.randrange(1, 12)])])
+    for timing in timings:
+        dateIncl = datetime(2024, 1, 1) + timedelta(days=rng.randrange(365))
+        mask = main.compileTiming(timing, dateIncl)
+        for day in range(0, 800, 3):
+            dateCheck = datetime(2024, 1, 1) + timedelta(days=day)
+            if timing[1] > 0 and dateCheck.isocalendar()[1] == 53:
+                continue
+            expected = oldIsGroupIncluded(timing, dateCheck, dateIncl)
+            assert main.maskIncludes(mask, dateCheck) == expected, (timing, dateCheck, dateIncl)
+            assert main.isGroupIncluded(timing, dateCheck, dateIncl) == expected
+
+# A task that is deleted and created again under the same name only keeps its new history
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_recreated_task_history_round_trip(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(main, "storageType", backend)
+    start = datetime(2024, 1, 1)
+
+    schedule = main.Schedule(str(tmp_path))
+    schedule.openSchedule()
+    schedule.createTask("a", main.CONTINUOUS, 10, start, "g", [0, 0, 0])
+    for day in range(10):
+        schedule.taskHistory.append("a", day % 2)
+    schedule.compactJournal()
+
+    schedule.removeTask("a")
+    schedule.createTask("a", main.CONTINUOUS, 10, start, "g2", [0, 0, 0])
+    schedule.taskHistory.append("a", 7)
+    schedule.taskHistory.append("a", 9)
+    schedule.compactJournal()
+
+    reloadSchedule(schedule)
+    history = schedule.taskHistory["a"]
+    assert (list(history.values), list(history.runs), history.days) == ([7, 9], [1, 1], 2)
+
+# Rules exported by calendar apps end on a UTC time (UNTIL=...Z), which is moved to local time
+def test_rule_with_utc_until():
+    group = main.Group("g", 0, 0, 0, date(2025, 1, 1), "FREQ=DAILY;UNTIL=20250105T120000Z")
+    assert "Z" not in group.rrule
+    days = main.forecastDays((group.mask,), date(2024, 12, 30).toordinal(), 10)
+    assert days == tuple(date(2025, 1, d) for d in range(1, 6))
+
+# Rules with a time zone other than UTC are rejected with a clear error
+def test_rule_with_time_zone():
+    try:
+        main.Group("g", 0, 0, 0, date(2025, 1, 1), "DTSTART;TZID=America/New_York:20250101T000000\nRRULE:FREQ=DAILY")
+    except ValueError as e:
+        assert "only UTC and local times" in str(e)
+    else:
+        assert False, "the rule should have been rejected"
+
+# A crash part way through writing a snapshot leaves the last full snapshot (and the journal) in use
+@pytest.mark.parametrize("failAt", range(1, 9))
+def test_snapshot_crash_keeps_last_snapshot(tmp_path, monkeypatch, failAt):
+    start = datetime(2024, 1, 1)
+    realReplace = main.os.replace
+
+    schedule = main.Schedule(str(tmp_path))
+    schedule.lastDate = start
+    schedule.saveData()
+    schedule.createTask("a", main.CONTINUOUS, 10, start, "g", [0, 0, 0])
+    schedule.compactJournal()
+    schedule.rollover(datetime(2024, 1, 3))
+
+    # Fail one of the renames that the next snapshot makes
+    calls = []
+    def crashingReplace(src, dst):
+        calls.append(dst)
+        if len(calls) == failAt:
+            raise OSError("crash")
+        realReplace(src, dst)
+    monkeypatch.setattr(main.os, "replace", crashingReplace)
+    with pytest.raises(OSError):
+        schedule.compactJournal()
+    monkeypatch.setattr(main.os, "replace", realReplace)
+
+    reloadSchedule(schedule)
+    assert schedule.taskHistory["a"].days == 2
+    schedule.compactJournal()
+    reloadSchedule(schedule)
+    assert schedule.taskHistory["a"].days == 2
+    assert sorted(name for name in main.os.listdir(tmp_path) if name.endswith(".tmp")) == []
+
+# Tasks with no history yet survive being loaded from a snapshot and saved in the next one
+def test_snapshot_of_empty_mapped_history(tmp_path):
+    schedule = main.Schedule(str(tmp_path))
+    schedule.openSchedule()
+    schedule.createTask("a", main.BINARY, -1, schedule.lastDate, "g", [0, 0, 0])
+    schedule.compactJournal()
+    reloadSchedule(schedule)
+    schedule.compactJournal()
+    reloadSchedule(schedule)
+    assert schedule.taskHistory["a"].days == 0
+
+# A rollover that another process already saved is a no-op when it is redone on top of that process's data
+def test_rebased_rollover_adds_no_history(tmp_path):
+    start = datetime(2024, 1, 1)
+    first = main.Schedule(str(tmp_path))
+    first.lastDate = start
+    first.saveData()
+    first.createTask("a", main.BINARY, -1, start, "g", [0, 0, 0])
+    second = main.Schedule(str(tmp_path))
+    second.loadData()
+    second.writeBehind = True
+
+    first.rollover(datetime(2024, 1, 5))
+    second.rollover(datetime(2024, 1, 5))
+    with pytest.raises(main.SaveConflict):
+        second.flushChanges()
+    assert second.rebaseChanges() == []
+    second.saveData()
+
+    reloadSchedule(second)
+    history = second.taskHistory["a"]
+    assert history.start + history.days == date(2024, 1, 5).toordinal()
+
+# Moving a task to its own group or removing it from its only group is rejected, rather than leaving the
+#   task with no groups
+def test_task_keeps_a_group(tmp_path):
+    schedule = main.Schedule(str(tmp_path))
+    schedule.openSchedule()
+    schedule.createTask("t", main.BINARY, -1, schedule.lastDate, "g", [0, 0, 0])
+    seq = schedule.journalSeq
+    with pytest.raises(ValueError):
+        schedule.moveTask("t", "g", "g")
+    with pytest.raises(ValueError):
+        schedule.removeTaskFromGroup("g", "t")
+    assert schedule.journalSeq == seq
+    assert schedule.groupsOf("t") == {"g"} and "g" in schedule.allGroups
+
+    schedule.createTask("u", main.BINARY, -1, schedule.lastDate, "h", [0, 0, 0])
+    schedule.addTaskToGroup("h", "t")
+    schedule.removeTaskFromGroup("g", "t")
+    assert schedule.groupsOf("t") == {"h"} and "g" not in schedule.allGroups
+
+# An import is checked in full before anything changes, so one bad record (including a history value that
+#   doesn't fit its task's type, wherever the task's record is) rejects the whole file
+@pytest.mark.parametrize("badRecord, message", [
+    (None, None),
+    ({"kind": "group", "name": "h", "day": 999}, "Import record 5: timing out of range"),
+    ({"kind": "task", "name": "c", "type": main.CONTINUOUS, "group": "g"}, "positive maxCont"),
+    ({"kind": "task", "name": "c", "type": 3, "group": "g"}, "task type must be"),
+    ({"kind": "history", "task": "a", "date": "2024-01-03", "value": 7}, "a on 2024-01-03: Invalid progress value"),
+    ({"kind": "history", "task": "b", "date": "2024-01-03", "value": 2}, "b on 2024-01-03: Invalid progress value"),
+    ({"kind": "history", "task": "a", "date": "2024-01-01", "value": 1}, "overlaps"),
+    ({"kind": "history", "task": "a", "date": "2024-01-09", "days": 2, "value": 1}, "goes past yesterday"),
+    ({"kind": "member", "group": "x", "task": "a"}, "unknown group x"),
+    ({"kind": "bogus"}, "unknown kind"),
+])
+def test_import_validation(tmp_path, badRecord, message):
+    records = [{"kind": "history", "task": "a", "date": "2024-01-01", "value": 3, "days": 2},
+               {"kind": "group", "name": "g", "day": 0, "week": 0, "month": 0},
+               {"kind": "task", "name": "a", "type": main.CONTINUOUS, "maxCont": 5, "group": "g"},
+               {"kind": "task", "name": "b", "type": main.BINARY, "group": "g"}]
+    if badRecord is not None:
+        records.append(badRecord)
+    path = tmp_path / "import.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    schedule = main.Schedule(str(tmp_path))
+    schedule.lastDate = datetime(2024, 1, 10)
+    schedule.saveData()
+
+    if message is not None:
+        with pytest.raises(ValueError, match=message):
+            schedule.importData(str(path))
+        assert schedule.allTasks == {} and schedule.allGroups == {}
+        return
+    assert schedule.importData(str(path))["records"] == 4
+    history = schedule.taskHistory["a"]
+    assert (list(history.values), list(history.runs), list(history.excluded)) == ([3, 0], [2, 7], [0, 1])
+
+# Progress values that don't fit the task's type are rejected before they are journaled
+def test_mark_rejects_bad_values(tmp_path):
+    server = main.ScheduleServer(str(tmp_path))
+    newTask = {"name": "run", "type": main.CONTINUOUS, "maxCont": 5, "group": "g", "timing": [0, 0, 0]}
+
+    async def requests():
+        assert (await server.handle("POST", "/users/u1/tasks", {}, newTask))[0] == 201
+        results = []
+        for value in ("abc", None, True, 2.5, -1, 6, 3):
+            results.append((await server.handle("POST", "/users/u1/tasks/run/mark", {}, {"value": value}))[0])
+        today = await server.handle("GET", "/users/u1/today", {}, None)
+        return results, today
+
+    results, today = asyncio.run(requests())
+    assert results == [400, 400, 400, 400, 400, 400, 200]
+    assert today[0] == 200 and today[1]["recurring"][0]["value"] == 3
+    server.saveAll()
+
+# New tasks are checked like imported ones: timings out of range and continuous tasks without a positive
+#   maxCont are rejected before anything is created
+def test_add_task_rejects_bad_fields(tmp_path):
+    server = main.ScheduleServer(str(tmp_path))
+    newTasks = [{"name": "a", "type": main.BINARY, "group": "g", "timing": [999, -50, 0]},
+                {"name": "a", "type": main.BINARY, "group": "g", "timing": [0, 0, "x"]},
+                {"name": "a", "type": main.CONTINUOUS, "group": "g", "timing": [0, 0, 0]},
+                {"name": "a", "type": main.CONTINUOUS, "maxCont": 0, "oneTime": True},
+                {"name": "a", "type": 3, "group": "g", "timing": [0, 0, 0]},
+                {"name": "a", "type": main.CONTINUOUS, "maxCont": 4, "group": "g", "timing": [-6, -3, -11]}]
+
+    async def requests():
+        results = [(await server.handle("POST", "/users/u1/tasks", {}, newTask))[0] for newTask in newTasks]
+        today = await server.handle("GET", "/users/u1/today", {}, None)
+        return results, today
+
+    results, today = asyncio.run(requests())
+    server.saveAll()
+    assert results == [400, 400, 400, 400, 400, 201]
+    assert today[1]["total"] == 1
+
+# A bad change saved by an older version is skipped when the journal is replayed
+def test_replay_skips_bad_progress_value(tmp_path):
+    schedule = main.Schedule(str(tmp_path))
+    schedule.openSchedule()
+    schedule.createTask("run", main.BINARY, -1, schedule.lastDate, "g", [0, 0, 0])
+    schedule.journalSeq += 1
+    schedule.openStorage().appendJournal([(schedule.journalSeq, "setProgress", ("run", "abc"))])
+    reloadSchedule(schedule)
+    assert schedule.tasksToday["run"] == 0
+
+# Task names in paths and queries are URL-decoded
+def test_server_decodes_urls(tmp_path):
+    server = main.ScheduleServer(str(tmp_path))
+    newTask = {"name": "Go running", "type": main.BINARY, "group": "g", "timing": [0, 0, 0]}
+
+    async def requests():
+        results = [(await server.handle("POST", "/users/u1/tasks", {}, newTask))[0],
+                   (await server.handle("POST", "/users/u1/tasks/Go%20running/mark", {}, {"value": 1}))[0]]
+        graph = await server.handle("GET", "/users/u1/graph", main.parseQuery("tasks=Go%20running&range=7"), None)
+        results.append((await server.handle("DELETE", "/users/u1/tasks/Go%20running", {}, None))[0])
+        return results, graph
+
+    results, graph = asyncio.run(requests())
+    assert results == [201, 200, 200]
+    assert list(graph[1]) == ["Go running"]
+    assert main.parseQuery("tasks=a+b,c%2Cd&x=") == {"tasks": "a b,c,d", "x": ""}
+    server.saveAll()
+
+# The server writes each request's changes off the event loop, and a schedule dropped from memory to make
+#   room for another one keeps changes that another process saved to it first
+def test_server_eviction_conflict(tmp_path, monkeypatch):
+    server = main.ScheduleServer(str(tmp_path), maxUsers=1)
+    userDir = str(tmp_path / main.USERS_DIR / "u1")
+    loopWrites = []
+    realWriteJournal = main.writeJournal
+    def recordingWriteJournal(*args):
+        try:
+            loopWrites.append(asyncio.get_running_loop())
+        except RuntimeError:    # Not on the event loop's thread
+            pass
+        return realWriteJournal(*args)
+    monkeypatch.setattr(main, "writeJournal", recordingWriteJournal)
+
+    def newTask(name):
+        return {"name": name, "type": main.BINARY, "group": "g", "timing": [0, 0, 0]}
+
+    def otherProcess():
+        other = main.Schedule(userDir)
+        other.openSchedule()
+        other.createTask("b", main.BINARY, -1, other.lastDate, "g", [0, 0, 0])
+        other.saveData()
+
+    async def requests():
+        results = [(await server.handle("POST", "/users/u1/tasks", {}, newTask("a")))[0]]
+        # u1 has an unwritten change when another process saves to its data directory
+        schedule = server.users["u1"].schedule
+        schedule.writeBehind = True
+        schedule.createTask("c", main.BINARY, -1, datetime.today(), "g", [0, 0, 0])
+        await asyncio.to_thread(otherProcess)
+        results.append((await server.handle("POST", "/users/u2/tasks", {}, newTask("d")))[0])
+        today = await server.handle("GET", "/users/u1/today", {}, None)
+        return results, today
+
+    results, today = asyncio.run(requests())
+    server.saveAll()
+    assert results == [201, 201]
+    assert sorted(task["name"] for task in today[1]["recurring"]) == ["a", "b", "c"]
+    assert loopWrites == []
+
+# Requests for different users run at the same time, since each user's schedule is its own Schedule
+def test_server_runs_users_in_parallel(tmp_path, monkeypatch):
+    server = main.ScheduleServer(str(tmp_path))
+    bothRunning = threading.Barrier(2, timeout=10)
+    realTodaysEntry = main.Schedule.todaysEntry
+    def waitingTodaysEntry(schedule):
+        bothRunning.wait()  # Only returns once the other user's request is running too
+        return realTodaysEntry(schedule)
+    monkeypatch.setattr(main.Schedule, "todaysEntry", waitingTodaysEntry)
+
+    async def requests():
+        return await asyncio.gather(server.handle("GET", "/users/u1/today", {}, None),
+                                    server.handle("GET", "/users/u2/today", {}, None))
+
+    results = asyncio.run(requests())
+    server.saveAll()
+    assert [result[0] for result in results] == [200, 200]
+
+# Backfilling a gap of days in one pass gives the same history (and last included dates) as rolling the
+#   schedule over one day at a time
+def test_backfill_matches_daily_rollover(tmp_path):
+    start = datetime(2024, 1, 1)
+
+    def build():
+        rng = random.Random(2)
+        schedule = main.Schedule(str(tmp_path))
+        schedule.lastDate = start
+        for g in range(20):
+            timing = [rng.choice([0, rng.randrange(1, 128), -rng.randrange(1, 7)]),
+                      rng.choice([0, rng.randrange(1, 1 << 52), -rng.randrange(1, 4)]),
+                      rng.choice([0, rng.randrange(1, 4096), -rng.randrange(1, 12)])]
+            rrule = "FREQ=MONTHLY;BYDAY=2TU" if g == 0 else None
+            schedule.allGroups["g" + str(g)] = main.Group("g" + str(g), timing[0], timing[1], timing[2], start, rrule)
+        for t in range(30):
+            groupNames = ["g" + str(g) for g in rng.sample(range(20), rng.randrange(1, 4))]
+            schedule.allTasks["t" + str(t)] = main.Task("t" + str(t), main.BINARY, groupNames[0])
+            for groupName in groupNames:
+                schedule.linkTask(schedule.allGroups[groupName], "t" + str(t))
+            schedule.taskHistory.create("t" + str(t), start)
+        schedule.getTodaysTasks(start)
+        return schedule
+
+    daily = build()
+    for day in range(1, 400):
+        daily.lastDate = daily.updateTime(start + timedelta(days=day))
+        daily.getTodaysTasks(daily.lastDate)
+    backfilled = build()
+    backfilled.lastDate = backfilled.updateTime(start + timedelta(days=399))
+    backfilled.getTodaysTasks(backfilled.lastDate)
+
+    for t in daily.allTasks:
+        expected, history = daily.taskHistory[t], backfilled.taskHistory[t]
+        assert (history.start, history.days) == (expected.start, expected.days) == (start.toordinal(), 399)
+        assert (list(history.values), list(history.runs), list(history.excluded)) == \
+            (list(expected.values), list(expected.runs), list(expected.excluded)), t
+    assert daily.tasksToday == backfilled.tasksToday
+    for groupName in daily.allGroups:
+        assert main.toDate(daily.allGroups[groupName].included) == main.toDate(backfilled.allGroups[groupName].included)
+
+# Task history columns start at 2 bytes and widen (values 'h' to 'd', runs 'H' to 'I') the first time
+#   something doesn't fit, keeping what was already there, and the widened columns survive a snapshot
+def test_task_history_widening(tmp_path):
+    history = main.TaskHistory(date(2024, 1, 1).toordinal())
+    history.append(3, 2)
+    history.append(0, 5, 1)
+    assert (history.values.typecode, history.runs.typecode) == ('h', 'H')
+
+    history.append(40000, 1)    # Too big for 'h'
+    assert history.values.typecode == 'd'
+    history.append(2.5, 1)
+    history.append(4, 65535)
+    history.append(4, 10)       # Merged into a run too long for 'H'
+    assert history.runs.typecode == 'I'
+    history.append(5, 70000)
+    expected = ([3, 0, 40000, 2.5, 4, 5], [2, 5, 1, 1, 65545, 70000], [0, 1, 0, 0, 0, 0])
+    assert (list(history.values), list(history.runs), list(history.excluded)) == expected
+    assert history.days == sum(expected[1])
+
+    # Any float widens values, even a whole number
+    floats = main.TaskHistory(0)
+    floats.append(1, 1)
+    floats.append(2.0, 1)
+    assert floats.values.typecode == 'd' and list(floats.values) == [1, 2]
+
+    schedule = main.Schedule(str(tmp_path))
+    schedule.openSchedule()
+    schedule.createTask("a", main.MEASURED, -1, schedule.lastDate, "g", [0, 0, 0])
+    schedule.taskHistory.tasks["a"] = history
+    schedule.taskHistory.dirty.add("a")
+    schedule.taskHistory.replaced.add("a")
+    schedule.compactJournal()
+    reloadSchedule(schedule)
+    loaded = schedule.taskHistory["a"]
+    assert (list(loaded.values), list(loaded.runs), list(loaded.excluded)) == expected
+
+# HistoryIndex.totals agrees with adding up the days one at a time for every prefix, including the empty
+#   one, run boundaries, and the whole history, both when it is built and as the history grows
+def test_history_index_totals_at_edges(tmp_path):
+    schedule = main.Schedule(str(tmp_path))
+    start = date(2024, 1, 1)
+    schedule.allTasks["a"] = main.Task("a", main.CONTINUOUS, "g", 4)
+    schedule.taskHistory.create("a", start)
+    for value, days, excluded in [(4, 3, 0), (0, 2, 1), (2, 1, 0), (4, 1, 0), (1, 4, 0)]:
+        if excluded:
+            schedule.taskHistory.exclude("a", days)
+        else:
+            schedule.taskHistory.append("a", value, days)
+    index = schedule.getHistoryIndex("a")
+    schedule.taskHistory.append("a", 1, 2)     # Merged into the last run after the index was built
+    schedule.taskHistory.append("a", 4, 1)
+
+    days = []
+    history = schedule.taskHistory["a"]
+    for value, runLen, excluded in zip(history.values, history.runs, history.excluded):
+        days.extend([(value, excluded)] * runLen)
+    for numDays in range(len(days) + 1):
+        included = [value for value, excluded in days[:numDays] if not excluded]
+        assert index.totals(numDays) == (len(included), sum(value >= 4 for value in included), sum(included))
+
+    # Ranges are limited to the recorded days, and empty ranges have no totals
+    assert schedule.historyRange("a", date(2023, 12, 1), date(2025, 1, 1)) == \
+        schedule.historyRange("a", start, date.fromordinal(start.toordinal() + len(days) - 1))
+    assert schedule.historyRange("a", date(2024, 1, 4), date(2024, 1, 5))["included"] == 0
+    assert schedule.historyRange("a", date(2024, 1, 3), date(2024, 1, 2))["included"] == 0
+    assert schedule.historyRange("a", date(2023, 1, 1), date(2023, 12, 31))["included"] == 0
+    assert schedule.historyDay("a", date(2023, 12, 31)) is None
+    assert schedule.historyDay("a", date.fromordinal(start.toordinal() + len(days))) is None
+    assert schedule.historyDay("a", date(2024, 1, 4))["excluded"]
+
+# CSV, JSON Lines, and columnar exports all read back as the same records, including one-time tasks and
+#   the history of a deleted task, and can be limited to a date range and a set of tasks
+def test_export_round_trip(tmp_path):
+    schedule = main.Schedule(str(tmp_path))
+    schedule.lastDate = datetime(2024, 1, 1)
+    schedule.saveData()
+    schedule.createTask("a", main.CONTINUOUS, 4, schedule.lastDate, "g", [0, 0, 0])
+    schedule.createTask("b", main.MEASURED, -1, schedule.lastDate, "h", [-2, 0, 0])
+    schedule.createTask("c", main.BINARY, -1, schedule.lastDate, "k", [0, 0, 0])
+    schedule.setProgress("a", 3)
+    schedule.setProgress("b", 2.5)
+    schedule.setProgress("c", 1)
+    schedule.createOneTimeTask("once, with a comma", main.BINARY, -1)
+    schedule.setProgress("once, with a comma", 1)
+    schedule.rollover(datetime(2024, 1, 5))
+    schedule.removeTask("c")
+    schedule.compactJournal()
+
+    expected = list(schedule.exportRecords(1, date.max.toordinal()))
+    assert ("c" in [record[1] for record in expected] and
+            all(record[3] == main.DELETED_TASK_TYPE for record in expected if record[1] == "c"))
+    assert (date(2024, 1, 1).toordinal(), "once, with a comma", "", main.BINARY, 1, 0) in expected
+
+    def normalize(day, name, groups, ttype, value, excluded):
+        day = date.fromisoformat(day).toordinal() if isinstance(day, str) else day
+        return (day, name, groups, int(ttype), float(value), int(excluded))
+
+    for fileName in ("export.csv", "export.jsonl", "export.bin"):
+        path = str(tmp_path / fileName)
+        assert schedule.exportData(path) == len(expected)
+        if fileName.endswith(".csv"):
+            with open(path, newline="") as f:
+                records = [tuple(row) for row in csv.reader(f)][1:]
+        elif fileName.endswith(".jsonl"):
+            with open(path) as f:
+                records = [tuple(json.loads(line)[field] for field in main.EXPORT_FIELDS) for line in f]
+        else:
+            records = list(main.readColumnarExport(path))
+        assert [normalize(*record) for record in records] == [normalize(*record) for record in expected], fileName
+
+        limited = [record for record in expected if record[1] == "a" and record[0] >= date(2024, 1, 2).toordinal()]
+        assert schedule.exportData(path, date(2024, 1, 2), date(2024, 1, 4), ["a"]) == len(limited) == 3